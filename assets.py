@@ -0,0 +1,90 @@
+import pygame
+from collections import OrderedDict
+
+# Rough size in bytes of a cached asset, so the cache can stay under its memory bound.
+# Handles surfaces, masks, and any lists/tuples/dicts of them. A subsurface (like an atlas frame) owns no
+# pixels of its own, so the surface it is cut from is counted instead, once however many frames share it.
+def asset_size(value, counted=None):
+    if counted is None:
+        counted = set()
+    if isinstance(value, pygame.Surface):
+        value = value.get_abs_parent()
+        if id(value) in counted:
+            return 0
+        counted.add(id(value))
+        return value.get_width() * value.get_height() * value.get_bytesize()
+    if isinstance(value, pygame.mask.Mask):
+        width, height = value.get_size()
+        return width * height // 8
+    if isinstance(value, dict):
+        return sum(asset_size(item, counted) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(asset_size(item, counted) for item in value)
+    return 0
+
+# Process-wide cache for images and sliced sprite sheets.
+# Entries are keyed by (path, frame size, direction flag) and shared between every entity that asks
+# for them, so they must never be changed by the caller. The least recently used entries are
+# dropped once the cache goes over max_bytes.
+class AssetCache():
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cached asset for key, calling loader() to build it on a miss
+    def get(self, key, loader):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        value = loader()
+        size = asset_size(value)
+        self.entries[key] = (value, size)
+        self.used_bytes += size
+        self.evict()
+        return value
+
+    # Drops least recently used entries until the cache fits its memory bound.
+    # The newest entry is always kept, even if it is bigger than the bound on its own.
+    def evict(self):
+        while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.used_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+    # Counters for debugging and benchmarks
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "used_bytes": self.used_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+# The shared cache used by the game
+cache = AssetCache()
+
+# Called when an image needs converting but there's no window yet (main sets this to its startup())
+display_starter = None
+
+# Loads an image once and hands out the same surface afterwards
+def load_image(path, alpha=True):
+    def loader():
+        image = pygame.image.load(path)
+        if alpha and pygame.display.get_surface() is None and display_starter is not None:
+            display_starter()
+        return image.convert_alpha() if alpha else image
+    return cache.get((path, None, alpha), loader)
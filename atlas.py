@@ -0,0 +1,104 @@
+import pygame
+
+# Packs sprite frames into a few big surfaces ("pages").
+#
+# Every frame handed out is a subsurface of a page, so it still works anywhere a Surface does, but all the
+# pixels live together in one place instead of in thousands of tiny surfaces. source() gives the page and
+# rect a frame lives at, so a whole list of frames can be drawn with one Surface.blits call (see blit_list).
+#
+# Frames are packed in rows ("shelves"): a frame goes on the current shelf if it fits, otherwise a new
+# shelf is started under it, and a new page once the page is full. Space isn't given back when frames stop
+# being used, so clear() it when switching to a completely different set of assets. Assets that come and go
+# (like the asset cache's sprite sheets) get a page of their own from pack_page instead, which is freed with them.
+class TextureAtlas():
+    def __init__(self, page_size=1024, padding=1):
+        self.page_size = page_size
+        self.padding = padding
+        self.pages = []
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    # Copies a surface into the atlas and returns its frame (a subsurface of a page)
+    def add(self, surface):
+        width, height = surface.get_size()
+        if width > self.page_size or height > self.page_size:
+            return surface  # Too big to pack, it just stays on its own
+
+        padding = self.padding
+        if not self.pages or self.shelf_x + width > self.page_size:
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height + padding
+            self.shelf_height = 0
+        if not self.pages or self.shelf_y + height > self.page_size:
+            self.pages.append(pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA, 32))
+            self.shelf_x = 0
+            self.shelf_y = 0
+            self.shelf_height = 0
+
+        page = self.pages[-1]
+        rect = pygame.Rect(self.shelf_x, self.shelf_y, width, height)
+        page.blit(surface, rect.topleft)
+
+        self.shelf_x += width + padding
+        self.shelf_height = max(self.shelf_height, height)
+        return page.subsurface(rect)
+
+    # Adds a list of frames, returns the atlas frames in the same order
+    def pack(self, surfaces):
+        return [self.add(surface) for surface in surfaces]
+
+    def clear(self):
+        self.pages = []
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    # Memory used by the pages, in bytes
+    def used_bytes(self):
+        return sum(page.get_width() * page.get_height() * page.get_bytesize() for page in self.pages)
+
+# Packs frames onto a page of their own, just big enough for them (shelves up to width wide).
+# Returns (page, frames), the frames being subsurfaces of the page in the same order as surfaces.
+def pack_page(surfaces, width=1024, padding=1):
+    rects = []
+    x = y = shelf_height = 0
+    for surface in surfaces:
+        frame_width, frame_height = surface.get_size()
+        if x and x + frame_width > width:
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        rects.append(pygame.Rect(x, y, frame_width, frame_height))
+        x += frame_width + padding
+        shelf_height = max(shelf_height, frame_height)
+
+    page = pygame.Surface((max([rect.right for rect in rects] + [1]), max([rect.bottom for rect in rects] + [1])),
+                          pygame.SRCALPHA, 32)
+    frames = []
+    for surface, rect in zip(surfaces, rects):
+        page.blit(surface, rect.topleft)
+        frames.append(page.subsurface(rect))
+    return page, frames
+
+# Where a frame's pixels are: (page, source rect). Surfaces that aren't in an atlas are their own page.
+def source(frame):
+    page = frame.get_parent()
+    if page is None:
+        return frame, None
+    return page, pygame.Rect(frame.get_offset(), frame.get_size())
+
+# Turns (frame, position) pairs into (page, position, area) for Surface.blits, so a batch of frames from
+# the same few pages is drawn in one call
+def blit_list(items):
+    blits = []
+    for frame, position in items:
+        page, area = source(frame)
+        if area is None:
+            blits.append((page, position))
+        else:
+            blits.append((page, position, area))
+    return blits
+
+# The atlas used by the game
+shared = TextureAtlas()
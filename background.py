@@ -0,0 +1,125 @@
+import pygame
+
+# The background behind the map.
+#
+# Each layer is one image repeated over the whole viewport, kept already drawn in a viewport sized surface in the
+# display's pixel format. Drawing the background is then one plain blit per layer instead of one blit per repeat
+# of the image (each paying for a pixel format conversion). A layer can scroll with the camera at a fraction of its
+# speed (parallax): when the camera moves, the layer's surface is scrolled and only the strips that came into view
+# are drawn again. A layer that doesn't scroll (factor 0) is drawn once and never again.
+
+# One repeated image, scrolling at factor times the camera's speed (0 stays put on the screen, 1 moves with the map)
+class BackgroundLayer():
+    def __init__(self, image, factor=0.0, alpha=False):
+        self.image = image
+        self.factor = factor
+        self.alpha = alpha
+        self.surface = None
+        self.scroll = None
+        self.redraws = 0
+        self.strip_pixels = 0
+
+    # Makes the layer's surface (only the bottom layer can be opaque, the rest have to let it show through)
+    def build(self, size):
+        if self.alpha:
+            self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        else:
+            self.surface = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert_alpha() if self.alpha else self.surface.convert()
+            self.image = self.image.convert_alpha() if self.alpha else self.image.convert()
+        self.scroll = None
+
+    # Draws the image repeated over area of the surface, as seen from the layer's scroll position
+    def fill(self, area):
+        surface = self.surface
+        width, height = self.image.get_size()
+        scroll_x, scroll_y = self.scroll
+
+        surface.set_clip(area)
+        if self.alpha:
+            surface.fill((0, 0, 0, 0), area)
+        y = area.top - (area.top + scroll_y) % height
+        while y < area.bottom:
+            x = area.left - (area.left + scroll_x) % width
+            while x < area.right:
+                surface.blit(self.image, (x, y))
+                x += width
+            y += height
+        surface.set_clip(None)
+        self.strip_pixels += area.width * area.height
+
+    # Moves the layer to match the camera, only drawing what scrolled into view
+    def update(self, offset_x, offset_y):
+        scroll = (round(offset_x * self.factor), round(offset_y * self.factor))
+        if scroll == self.scroll:
+            return
+
+        surface_rect = self.surface.get_rect()
+        if self.scroll is None:
+            self.scroll = scroll
+            self.fill(surface_rect)
+            self.redraws += 1
+            return
+
+        dx = scroll[0] - self.scroll[0]
+        dy = scroll[1] - self.scroll[1]
+        self.scroll = scroll
+        if abs(dx) >= surface_rect.width or abs(dy) >= surface_rect.height:
+            self.fill(surface_rect)
+            self.redraws += 1
+            return
+
+        # Moves what is still in view, then draws the strips along the edges that came in
+        self.surface.scroll(-dx, -dy)
+        if dx > 0:
+            self.fill(pygame.Rect(surface_rect.width - dx, 0, dx, surface_rect.height))
+        elif dx < 0:
+            self.fill(pygame.Rect(0, 0, -dx, surface_rect.height))
+        if dy > 0:
+            self.fill(pygame.Rect(0, surface_rect.height - dy, surface_rect.width, dy))
+        elif dy < 0:
+            self.fill(pygame.Rect(0, 0, surface_rect.width, -dy))
+
+# Every layer of the background, bottom first, each kept in a surface the size of the viewport
+class Background():
+    def __init__(self, layers, size):
+        self.layers = layers
+        self.size = size
+        # Layers only scroll every update_interval draws (lower quality tiers raise it, see governor.py)
+        self.update_interval = 1
+        self.draws = 0
+        self.scaled_copies = {}
+        for layer in layers:
+            layer.build(size)
+
+    # Draws the background for a camera offset (only inside the canvas' clip rect, if it has one)
+    def draw(self, canvas, offset_x, offset_y):
+        scroll = self.draws % self.update_interval == 0
+        self.draws += 1
+        for layer in self.layers:
+            if scroll or layer.scroll is None:
+                layer.update(offset_x, offset_y)
+            canvas.blit(layer.surface, (0, 0))
+
+    # The same background at a fraction of the size (for render.ScaledRenderer), made the first time it's asked for
+    def scaled(self, scale):
+        background = self.scaled_copies.get(scale)
+        if background is None:
+            layers = []
+            for layer in self.layers:
+                width, height = layer.image.get_size()
+                image = pygame.transform.scale(layer.image, (max(1, round(width * scale)), max(1, round(height * scale))))
+                layers.append(BackgroundLayer(image, layer.factor, layer.alpha))
+            size = (max(1, round(self.size[0] * scale)), max(1, round(self.size[1] * scale)))
+            background = self.scaled_copies[scale] = Background(layers, size)
+        background.update_interval = self.update_interval
+        return background
+
+    # Counters for debugging and benchmarks
+    def stats(self):
+        return {
+            "layers": len(self.layers),
+            "full_redraws": sum(layer.redraws for layer in self.layers),
+            "pixels_drawn": sum(layer.strip_pixels for layer in self.layers),
+        }
@@ -0,0 +1,265 @@
+# Benchmarks for the game's hot paths: loading, collision, simulation and drawing.
+# Runs headless and writes machine readable JSON.
+#
+#   python bench.py --out bench.json              # run everything and save the results
+#   python bench.py --compare bench.json          # run again and fail if anything got slower
+#   python bench.py --only collide --quick        # run some of the benchmarks with less repeats
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+
+import headless
+import pygame
+import main
+from main import Game, InputState, Player, Rune, Enemy, TileMap
+
+# Sizes (columns, rows) of the generated maps
+MAP_SIZES = {
+    "small": (50, 20),
+    "medium": (200, 40),
+    "huge": (1000, 60),
+}
+
+TILE_IDS = ["0", "1", "2", "5", "6", "7"]
+
+# Writes a random map csv the same way the level editor does, with a solid floor so entities have ground.
+def make_map(path, columns, rows, seed=0, density=0.25):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as data:
+        writer = csv.writer(data)
+        for row in range(rows):
+            if row >= rows - 2:
+                writer.writerow([rng.choice(TILE_IDS) for _ in range(columns)])
+            else:
+                writer.writerow([rng.choice(TILE_IDS) if rng.random() < density else "-1" for _ in range(columns)])
+    return path
+
+# Times fn and returns nanoseconds per call (the best of a few repeats, so noise only makes it slower)
+def time_op(fn, min_time=0.2, repeats=3):
+    fn()  # Warm up caches (baked chunks, masks, etc.)
+
+    # Figures out how many calls fill min_time
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9 / 4 or number >= 1 << 20:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / number)
+    return best
+
+# Makes a result entry for one timed operation
+def result(ns, **params):
+    entry = {"ns_per_op": round(ns, 1), "ops_per_second": round(1e9 / ns, 1) if ns else None}
+    entry.update(params)
+    return entry
+
+# Puts a player on the floor of a map, so collision checks have tiles to look at
+def make_player(tilemap):
+    player = Player(tilemap.tile_size * 2, tilemap.tile_map_h - tilemap.tile_size * 2 - 50, 50, 50)
+    player.loop(main.FPS)
+    return player
+
+# Spreads count runes around the player
+def make_runes(count, near, seed=0):
+    rng = random.Random(seed)
+    return [Rune(near.x + rng.randint(-2000, 2000), near.y + rng.randint(-600, 600), 32, 64) for _ in range(count)]
+
+def bench_load_tiles(maps, args):
+    results = {}
+    for name, path in maps.items():
+        tilemap = TileMap(path)
+        ns = time_op(lambda: tilemap.load_tiles(path), args.min_time)
+        results[name] = result(ns, tiles=len(tilemap.tiles))
+    return results
+
+def bench_collide(maps, args):
+    results = {"tiles": [], "objects": []}
+
+    # Grows the map, no objects
+    for name, path in maps.items():
+        tilemap = TileMap(path)
+        player = make_player(tilemap)
+        ns = time_op(lambda: main.collide(player, [], tilemap, main.PLAYER_VEL * 2), args.min_time)
+        results["tiles"].append(result(ns, map=name, n=len(tilemap.tiles)))
+
+    # Grows the number of objects, small map
+    tilemap = TileMap(maps["small"])
+    player = make_player(tilemap)
+    for count in args.counts:
+        objects = make_runes(count, player.rect)
+        ns = time_op(lambda: main.collide(player, objects, tilemap, main.PLAYER_VEL * 2), args.min_time)
+        results["objects"].append(result(ns, n=count))
+    return results
+
+def bench_vertical_collision(maps, args):
+    results = {"tiles": [], "objects": []}
+
+    # The player is put back after every call, so each call does the same work
+    def vertical(player, objects, tilemap):
+        x, y, y_vel = player.rect.x, player.rect.y, player.y_vel
+        main.handle_vertical_collision(player, objects, tilemap, 4)
+        player.rect.topleft = (x, y)
+        player.y_vel = y_vel
+
+    for name, path in maps.items():
+        tilemap = TileMap(path)
+        player = make_player(tilemap)
+        ns = time_op(lambda: vertical(player, [], tilemap), args.min_time)
+        results["tiles"].append(result(ns, map=name, n=len(tilemap.tiles)))
+
+    tilemap = TileMap(maps["small"])
+    player = make_player(tilemap)
+    for count in args.counts:
+        objects = make_runes(count, player.rect)
+        ns = time_op(lambda: vertical(player, objects, tilemap), args.min_time)
+        results["objects"].append(result(ns, n=count))
+    return results
+
+def bench_enemy_collisions(maps, args):
+    results = []
+    tilemap = TileMap(maps["small"])
+    player = make_player(tilemap)
+    rng = random.Random(0)
+
+    for count in args.counts:
+        enemies = []
+        for _ in range(count):
+            enemy = Enemy(player.rect.x + rng.randint(300, 3000), player.rect.y + rng.randint(-600, 600), 32, 32)
+            enemy.loop(main.FPS)
+            enemies.append(enemy)
+        ns = time_op(lambda: main.handle_enemy_collisions(player, enemies), args.min_time)
+        results.append(result(ns, n=count))
+    return results
+
+def bench_draw(maps, args):
+    results = {"draw_map": {}}
+    surface = pygame.Surface((main.WIDTH, main.HEIGHT))
+
+    for name, path in maps.items():
+        tilemap = TileMap(path)
+        offset_y = max(0, tilemap.tile_map_h - main.HEIGHT)
+        ns = time_op(lambda: tilemap.draw_map(surface, 500, offset_y), args.min_time)
+        results["draw_map"][name] = result(ns, tiles=len(tilemap.tiles))
+
+    # Full frame, same as what draw() does in the game (including the window blit and display update)
+    game = Game()
+    game.step(InputState())
+    ox, oy = int(game.offset_x), int(game.offset_y)
+    ns = time_op(lambda: main.draw(surface, headless.window, game.background, game.player, game.active_objects,
+                                   game.active_runes, game.active_enemies, game.tilemap, ox, oy), args.min_time)
+    results["frame"] = result(ns, fps=round(1e9 / ns, 1))
+    return results
+
+def bench_tick(maps, args):
+    game = Game()
+    tick = [0]
+
+    # Holds right and jumps every now and then, like a real run through the level
+    def step():
+        tick[0] += 1
+        game.step(InputState(right=True, jump=tick[0] % 45 == 0))
+
+    ns = time_op(step, args.min_time)
+    return result(ns, fps=round(1e9 / ns, 1))
+
+BENCHMARKS = {
+    "load_tiles": bench_load_tiles,
+    "collide": bench_collide,
+    "vertical_collision": bench_vertical_collision,
+    "enemy_collisions": bench_enemy_collisions,
+    "draw": bench_draw,
+    "tick": bench_tick,
+}
+
+# Walks two result trees side by side and yields (name, old ns, new ns) for every timed operation
+def compare_entries(old, new, name=""):
+    if isinstance(new, dict) and "ns_per_op" in new:
+        if isinstance(old, dict) and old.get("ns_per_op"):
+            yield name, old["ns_per_op"], new["ns_per_op"]
+    elif isinstance(new, dict):
+        for key, value in new.items():
+            if isinstance(old, dict) and key in old:
+                yield from compare_entries(old[key], value, f"{name}.{key}" if name else key)
+    elif isinstance(new, list) and isinstance(old, list):
+        for i, (old_value, value) in enumerate(zip(old, new)):
+            label = value.get("map", value.get("n", i)) if isinstance(value, dict) else i
+            yield from compare_entries(old_value, value, f"{name}[{label}]")
+
+# Prints how each operation changed against the baseline and returns the names that got slower than threshold
+def compare(baseline, current, threshold):
+    regressions = []
+    for name, old_ns, new_ns in compare_entries(baseline["results"], current["results"]):
+        change = (new_ns - old_ns) / old_ns
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:45} {old_ns:14.0f} ns -> {new_ns:14.0f} ns  {change:+7.1%}{flag}")
+    return regressions
+
+def run(args):
+    with tempfile.TemporaryDirectory() as folder:
+        maps = {name: make_map(os.path.join(folder, name + ".csv"), *size) for name, size in MAP_SIZES.items()}
+        if args.quick:
+            maps.pop("huge")
+
+        results = {}
+        for name, benchmark in BENCHMARKS.items():
+            if args.only and not any(only in name for only in args.only):
+                continue
+            print(f"running {name}...", file=sys.stderr)
+            results[name] = benchmark(maps, args)
+
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the game's hot paths.")
+    parser.add_argument("--out", help="write the results to this JSON file (default: print them)")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown that counts as a regression (0.15 = 15%%)")
+    parser.add_argument("--only", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--quick", action="store_true", help="shorter runs and no huge map")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend timing each operation")
+    args = parser.parse_args()
+
+    args.counts = [10, 100, 1000] if args.quick else [10, 100, 1000, 5000]
+    if args.quick:
+        args.min_time = min(args.min_time, 0.05)
+
+    report = run(args)
+
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump(report, out, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from operator import itemgetter
+
+
+# Index of each part of an entry
+MIN_X, MAX_X, MIN_Y, MAX_Y, ORDER, ENTITY, STATIC = range(7)
+
+# The box an entity can collide in: its rect, grown to fit its mask (sprites can be bigger than the rect)
+def bounds(entity):
+    rect = entity.rect
+    mask = getattr(entity, "mask", None)
+    if mask is None:
+        return rect.left, rect.right, rect.top, rect.bottom
+    width, height = mask.get_size()
+    return rect.left, max(rect.right, rect.left + width), rect.top, max(rect.bottom, rect.top + height)
+
+# Sort and sweep broadphase.
+#
+# Keeps every entity's box in a list sorted by its left edge. update() re-reads the boxes and sorts again,
+# which is close to free because things only move a little each tick and the list is already almost sorted.
+# Adding and removing only mark the list as unsorted, so filling it is one sort on the next query, not one per entity.
+# query() finds the entities whose boxes overlap a rect, so the expensive mask tests only run on things that are
+# actually close.
+# Results come back in the order the entities were added, so code that stops at the first hit still
+# finds the same thing it did when it looped over the full list.
+class SweepAndPrune():
+    def __init__(self, entities=()):
+        self.entries = []
+        self.by_id = {}
+        self.left_edges = []
+        self.max_width = 0
+        self.next_order = 0
+        self.unsorted = False
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, entity):
+        return id(entity) in self.by_id
+
+    # Adds an entity. Static entities never move, so update() skips reading their box again.
+    # rect gives the entity a fixed box of its own instead of its current one (it's always static).
+    def add(self, entity, static=False, rect=None):
+        if id(entity) in self.by_id:
+            return
+        if rect is None:
+            box = bounds(entity)
+        else:
+            box = rect.left, rect.right, rect.top, rect.bottom
+            static = True
+        entry = [*box, self.next_order, entity, static]
+        self.next_order += 1
+        self.by_id[id(entity)] = entry
+        self.entries.append(entry)
+        self.unsorted = True
+
+    def remove(self, entity):
+        entry = self.by_id.pop(id(entity), None)
+        if entry is not None:
+            self.entries.remove(entry)
+            self.unsorted = True
+
+    # Makes the broadphase hold exactly these entities (adding and removing as needed)
+    def sync(self, entities):
+        wanted = {id(entity): entity for entity in entities}
+        removed = [entry for entry in self.entries if id(entry[ENTITY]) not in wanted]
+        for entry in removed:
+            del self.by_id[id(entry[ENTITY])]
+        if removed:
+            self.entries = [entry for entry in self.entries if id(entry[ENTITY]) in self.by_id]
+        for entity in entities:
+            if id(entity) not in self.by_id:
+                entry = [*bounds(entity), self.next_order, entity, False]
+                self.next_order += 1
+                self.by_id[id(entity)] = entry
+                self.entries.append(entry)
+        self.update()
+
+    # Re-reads the box of everything that moves and puts the list back in order
+    def update(self):
+        for entry in self.entries:
+            if not entry[STATIC]:
+                entry[MIN_X], entry[MAX_X], entry[MIN_Y], entry[MAX_Y] = bounds(entry[ENTITY])
+        self.sort()
+
+    def sort(self):
+        self.entries.sort(key=itemgetter(MIN_X))
+        self.left_edges = [entry[MIN_X] for entry in self.entries]
+        self.max_width = max((entry[MAX_X] - entry[MIN_X] for entry in self.entries), default=0)
+        self.unsorted = False
+
+    # Entities whose box overlaps rect, in the order they were added
+    def query(self, rect):
+        if self.unsorted:
+            self.sort()
+        # Nothing that starts more than the widest box to the left of rect can reach it
+        first = bisect_left(self.left_edges, rect.left - self.max_width)
+        last = bisect_left(self.left_edges, rect.right)
+        found = [entry for entry in self.entries[first:last]
+                 if entry[MAX_X] > rect.left and entry[MIN_Y] < rect.bottom and entry[MAX_Y] > rect.top]
+        found.sort(key=itemgetter(ORDER))
+        return [entry[ENTITY] for entry in found]
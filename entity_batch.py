@@ -0,0 +1,174 @@
+import pygame
+
+# numpy is optional, the game works without it (only the batched entities need it)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Batched enemies and runes.
+#
+# Instead of calling Enemy.loop / Rune.loop on every entity every tick, their state is kept in numpy arrays
+# (one array per field, one slot per entity) and advanced for all of them at once. The results are the same
+# as the Enemy and Rune classes tick for tick.
+#
+# The Enemy and Rune objects are still used for collisions and drawing, but only the ones that are needed
+# (near the camera) get their state copied over with sync(). Anything done to those objects, like
+# makeHit from a collision, is copied back into the arrays with pull().
+
+LEFT, RIGHT = 0, 1
+DIRECTIONS = ("left", "right")
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Batched entities need numpy (pip install numpy)")
+
+# Finds the entities whose rect (x, y, width, height arrays) overlaps area
+def overlapping(x, y, width, height, area):
+    return np.nonzero((x < area.right) & (x + width > area.left) & (y < area.bottom) & (y + height > area.top))[0]
+
+# All of the enemies' loop / patrol / hit timer / sprite state as arrays
+class EnemyBatch():
+
+    # Sheet names in the order used by the sheet index: (state * 2 + direction)
+    STATES = ("moving", "hit", "dead")
+
+    def __init__(self, enemies):
+        require_numpy()
+        first = enemies[0]
+        self.sprites = first.sprites
+        self.masks = first.masks
+        self.animation_delay = first.ANIMATION_DELAY
+        self.sheet_names = [state + "_" + direction for state in self.STATES for direction in DIRECTIONS]
+        self.frame_counts = np.array([len(self.sprites[name]) for name in self.sheet_names])
+        self.frame_sizes = np.array([self.sprites[name][0].get_size() for name in self.sheet_names])
+
+        self.x = np.array([enemy.rect.x for enemy in enemies], dtype=np.int64)
+        self.y = np.array([enemy.rect.y for enemy in enemies], dtype=np.int64)
+        self.width = np.array([enemy.rect.width for enemy in enemies], dtype=np.int64)
+        self.height = np.array([enemy.rect.height for enemy in enemies], dtype=np.int64)
+        self.x_vel = np.array([enemy.x_vel for enemy in enemies], dtype=np.int64)
+        self.left_bound = np.array([enemy.patrol_left_bound for enemy in enemies], dtype=np.float64)
+        self.right_bound = np.array([enemy.patrol_right_bound for enemy in enemies], dtype=np.float64)
+        self.direction = np.array([DIRECTIONS.index(enemy.direction) for enemy in enemies], dtype=np.int64)
+        self.animation_count = np.array([enemy.animation_count for enemy in enemies], dtype=np.int64)
+        self.hit = np.array([enemy.hit for enemy in enemies], dtype=bool)
+        self.hit_count = np.array([enemy.hit_count for enemy in enemies], dtype=np.int64)
+        self.can_move = np.array([enemy.can_move for enemy in enemies], dtype=bool)
+        self.alive = np.array([enemy.is_alive for enemy in enemies], dtype=bool)
+        self.health = np.array([enemy.health_display.current_health for enemy in enemies], dtype=np.int64)
+        self.sheet = np.zeros(len(enemies), dtype=np.int64)
+        self.frame = np.zeros(len(enemies), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    # Same as Enemy.loop for every enemy
+    def step(self, FPS):
+        # Patrol back and forth within bounds (Enemy.patrol), then move
+        moving = self.alive & self.can_move
+        at_right = moving & (self.x >= self.right_bound)
+        at_left = moving & ~at_right & (self.x <= self.left_bound)
+        self.direction[at_right] = LEFT
+        self.x_vel[at_right] = -np.abs(self.x_vel[at_right])
+        self.direction[at_left] = RIGHT
+        self.x_vel[at_left] = np.abs(self.x_vel[at_left])
+        self.animation_count[at_right | at_left] = 0
+        self.x[moving] += self.x_vel[moving]
+
+        # Reset hit state after delay
+        self.hit_count[self.hit] += 1
+        recovered = self.hit & (self.hit_count > FPS)
+        self.hit[recovered] = False
+        self.can_move[recovered] = True
+
+        # Picks the sheet and frame (Enemy.update_sprite)
+        state = np.where(~self.alive, 2, np.where(self.hit, 1, 0))
+        self.can_move[~self.alive] = False
+        self.sheet = state * 2 + self.direction
+        self.frame = (self.animation_count // self.animation_delay) % self.frame_counts[self.sheet]
+        self.animation_count += 1
+
+        # The rect takes the size of the sprite (Enemy.update)
+        self.width = self.frame_sizes[self.sheet, 0]
+        self.height = self.frame_sizes[self.sheet, 1]
+
+    # Indexes of the enemies that overlap a rect
+    def in_rect(self, area):
+        return overlapping(self.x, self.y, self.width, self.height, area)
+
+    # Sprite sheet name and frame index of every enemy, for the draw pass
+    def frames(self):
+        return [self.sheet_names[sheet] for sheet in self.sheet], self.frame
+
+    # Copies the batch's state onto the Enemy objects at indexes
+    def sync(self, enemies, indexes):
+        for i in indexes:
+            enemy = enemies[i]
+            name = self.sheet_names[self.sheet[i]]
+            frame = int(self.frame[i])
+            enemy.rect = pygame.Rect(int(self.x[i]), int(self.y[i]), int(self.width[i]), int(self.height[i]))
+            enemy.x_vel = int(self.x_vel[i])
+            enemy.direction = DIRECTIONS[self.direction[i]]
+            enemy.animation_count = int(self.animation_count[i])
+            enemy.hit = bool(self.hit[i])
+            enemy.hit_count = int(self.hit_count[i])
+            enemy.can_move = bool(self.can_move[i])
+            enemy.is_alive = bool(self.alive[i])
+            enemy.sprite_sheet_name = name
+            enemy.sprite_index = frame
+            enemy.sprite = self.sprites[name][frame]
+            enemy.mask = self.masks[name][frame]
+            enemy.health_display.current_health = int(self.health[i])
+            enemy.health_display.update()
+
+    # Copies hit state changed on the Enemy objects at indexes (by collisions) back into the batch
+    def pull(self, enemies, indexes):
+        for i in indexes:
+            enemy = enemies[i]
+            self.hit[i] = enemy.hit
+            self.hit_count[i] = enemy.hit_count
+            self.can_move[i] = enemy.can_move
+            self.alive[i] = enemy.is_alive
+            self.health[i] = enemy.health_display.current_health
+
+# All of the runes' animation state as arrays
+class RuneBatch():
+    def __init__(self, runes):
+        require_numpy()
+        first = runes[0]
+        self.sprites = first.rune
+        self.masks = first.rune_masks
+        self.animation_name = first.animation_name
+        self.animation_delay = first.ANIMATION_DELAY
+        frames = self.sprites[self.animation_name]
+        self.frame_count = len(frames)
+        self.frame_width, self.frame_height = frames[0].get_size()
+
+        self.x = np.array([rune.rect.x for rune in runes], dtype=np.int64)
+        self.y = np.array([rune.rect.y for rune in runes], dtype=np.int64)
+        self.width = np.array([rune.rect.width for rune in runes], dtype=np.int64)
+        self.height = np.array([rune.rect.height for rune in runes], dtype=np.int64)
+        self.animation_count = np.array([rune.animation_count for rune in runes], dtype=np.int64)
+        self.frame = np.zeros(len(runes), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    # Same as Rune.loop for every rune
+    def step(self):
+        self.frame = (self.animation_count // self.animation_delay) % self.frame_count
+        self.animation_count += 1
+        self.animation_count[self.animation_count // self.animation_delay > self.frame_count] = 0
+        self.width[:] = self.frame_width
+        self.height[:] = self.frame_height
+
+    def in_rect(self, area):
+        return overlapping(self.x, self.y, self.width, self.height, area)
+
+    # Copies the batch's state onto the Rune objects at indexes
+    def sync(self, runes, indexes):
+        for i in indexes:
+            rune = runes[i]
+            rune.animation_count = int(self.animation_count[i])  # The rune's frame and mask follow from its count
+            rune.rect = pygame.Rect(int(self.x[i]), int(self.y[i]), self.frame_width, self.frame_height)
@@ -0,0 +1,133 @@
+import json
+import time
+from array import array
+
+# Adaptive quality for machines that can't keep up with the frame rate.
+#
+# The governor times how long each frame's work takes (not the time clock.tick sleeps) and keeps the last few
+# hundred in a ring buffer. When the average over the last window of frames is over budget it drops one quality
+# tier, and when it has been well under budget for a longer stretch it goes back up one. The gap between the
+# two thresholds, and needing a full window at a tier before deciding again, stop it flipping between tiers
+# every few frames (hysteresis).
+#
+# Tiers only change how the game is drawn, never what it simulates, so replays and playtests aren't affected.
+
+# One quality tier.
+# animation_margin: enemies further than this outside the screen keep their last frame (None animates all of them).
+# background_interval: parallax layers scroll once every this many frames.
+# render_scale: fraction of the window's resolution the game is drawn at before it is scaled up to fill it.
+class QualityTier():
+    def __init__(self, name, animation_margin=None, background_interval=1, render_scale=1.0):
+        self.name = name
+        self.animation_margin = animation_margin
+        self.background_interval = background_interval
+        self.render_scale = render_scale
+
+# Best first
+TIERS = (
+    QualityTier("high"),
+    QualityTier("medium", animation_margin=128, background_interval=2),
+    QualityTier("low", animation_margin=0, background_interval=4, render_scale=0.5),
+)
+
+class FrameGovernor():
+    # budget_ms: time a frame's work has to fit in (one frame at the target FPS)
+    # window: frames averaged for a decision, and frames to wait at a tier before deciding again
+    # downgrade/upgrade: fractions of the budget to go down a tier above, or up a tier below
+    # upgrade_windows: how many windows in a row have to be under the upgrade line to go back up
+    def __init__(self, budget_ms=1000 / 60, tiers=TIERS, size=600, window=30, downgrade=1.1, upgrade=0.6,
+                 upgrade_windows=4, enabled=True):
+        self.budget_ms = budget_ms
+        self.tiers = tiers
+        self.size = size
+        self.window = window
+        self.downgrade = downgrade
+        self.upgrade = upgrade
+        self.upgrade_windows = upgrade_windows
+        self.enabled = enabled
+
+        self.frame_times = array("d", bytes(8 * size))
+        self.tier_history = array("b", bytes(size))
+        self.index = 0
+        self.count = 0
+        self.frames = 0
+        self.tier_index = 0
+        self.frames_at_tier = 0
+        self.changes = []  # (frame, old tier, new tier, average ms) for every tier change
+        self.frame_start = 0.0
+
+    @property
+    def tier(self):
+        return self.tiers[self.tier_index]
+
+    # Starts timing a frame's work
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    # Finishes timing the frame. Returns True if the tier changed, so the caller knows to apply it.
+    def end_frame(self):
+        return self.record((time.perf_counter() - self.frame_start) * 1000)
+
+    # Adds one frame time (in ms) and moves the tier if it needs to. Returns True if the tier changed.
+    def record(self, frame_ms):
+        index = self.index
+        self.frame_times[index] = frame_ms
+        self.tier_history[index] = self.tier_index
+        self.index = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.frames += 1
+        self.frames_at_tier += 1
+
+        if not self.enabled or self.frames_at_tier < self.window:
+            return False
+
+        average = self.average(self.window)
+        if average > self.budget_ms * self.downgrade and self.tier_index < len(self.tiers) - 1:
+            return self.set_tier(self.tier_index + 1, average)
+
+        # Going back up needs a longer stretch under budget, so one quiet moment doesn't bring the stutter back
+        up_frames = self.window * self.upgrade_windows
+        if (self.tier_index > 0 and self.frames_at_tier >= up_frames and
+                self.average(up_frames) < self.budget_ms * self.upgrade):
+            return self.set_tier(self.tier_index - 1, average)
+        return False
+
+    def set_tier(self, tier_index, average=None):
+        if tier_index == self.tier_index:
+            return False
+        self.changes.append((self.frames, self.tier.name, self.tiers[tier_index].name, average))
+        self.tier_index = tier_index
+        self.frames_at_tier = 0
+        return True
+
+    # Average of the last frames frame times, in ms
+    def average(self, frames):
+        values = self.ordered(self.frame_times)[-frames:]
+        return sum(values) / len(values) if values else 0.0
+
+    # Values in a ring buffer from oldest to newest
+    def ordered(self, buffer):
+        if self.count < self.size:
+            return list(buffer[:self.count])
+        return list(buffer[self.index:]) + list(buffer[:self.index])
+
+    # The current tier and recent frame times, for telemetry
+    def telemetry(self):
+        return {
+            "units": "ms",
+            "tier": self.tier.name,
+            "tier_index": self.tier_index,
+            "budget_ms": self.budget_ms,
+            "average_ms": self.average(self.window),
+            "frames": self.frames,
+            "frame_times": self.ordered(self.frame_times),
+            "tiers": [self.tiers[index].name for index in self.ordered(self.tier_history)],
+            "changes": list(self.changes),
+        }
+
+    # Writes the telemetry with a timestamp in the name, returns the path
+    def dump(self, prefix="quality"):
+        path = time.strftime(f"{prefix}_%Y%m%d_%H%M%S") + ".json"
+        with open(path, "w") as out:
+            json.dump(self.telemetry(), out, indent=2)
+        return path
@@ -0,0 +1,48 @@
+# Runs the game without a window on SDL's dummy video driver, with no frame cap.
+# Importing this starts pygame headless, so import it before anything calls main.startup().
+#
+#   python headless.py --ticks 5000
+import time
+import argparse
+
+import main
+from main import Game, InputState
+
+window = main.startup(headless=True)
+
+# Runs a game for a number of ticks as fast as possible.
+# inputs can be a single InputState used every tick, or a function that takes the tick number and returns one.
+# Returns the game and how many ticks per second it ran at.
+def run(ticks, inputs=None, level="GoblinBroMap1.csv", game=None):
+    if game is None:
+        game = Game(level)
+    if inputs is None:
+        inputs = InputState()
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        game.step(inputs(tick) if callable(inputs) else inputs)
+    elapsed = time.perf_counter() - start
+
+    # Far away enemies and runes may be asleep, brings them up to date so the game can be looked at
+    game.catch_up_sleeping()
+
+    return game, ticks / elapsed if elapsed > 0 else float("inf")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steps the game headless and reports simulation speed.")
+    parser.add_argument("--ticks", type=int, default=3000)
+    parser.add_argument("--level", default="GoblinBroMap1.csv")
+    parser.add_argument("--right", action="store_true", help="hold right the whole run")
+    parser.add_argument("--startup-report", action="store_true", help="print how long startup took")
+    args = parser.parse_args()
+
+    game = Game(args.level)
+    main.startup_report.first_frame()
+    if args.startup_report:
+        print(main.startup_report.report())
+
+    game, ticks_per_second = run(args.ticks, InputState(right=args.right), game=game)
+    player = game.player
+    print(f"{args.ticks} ticks, {ticks_per_second:.0f} ticks/s ({ticks_per_second / main.FPS:.1f}x real time)")
+    print(f"player at {player.rect.topleft}, health {player.health_display.current_health}")
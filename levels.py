@@ -0,0 +1,136 @@
+import os
+import sys
+import csv
+import mmap
+import array
+import struct
+import hashlib
+import tempfile
+
+# Compiled level files.
+#
+# Parsing a big csv map on every launch is slow, so the first load compiles it to a .lvl file next to it:
+# a small header followed by every tile id as a little endian int16, row by row (-1 is empty).
+# The file is memory mapped when loaded, and compiled again when the csv's mtime and hash no longer match.
+
+MAGIC = b"GBLV"
+VERSION = 1
+# magic, version, width, height, csv mtime (ns), csv sha1
+HEADER = struct.Struct("<4sHxxIIq20s")
+EMPTY = -1
+
+# A loaded level: width and height in tiles, and the tile ids as a flat sequence of ints (row by row)
+class Level():
+    def __init__(self, width, height, ids):
+        self.width = width
+        self.height = height
+        self.ids = ids
+
+    def id_at(self, col, row):
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return self.ids[row * self.width + col]
+        return EMPTY
+
+# Where the compiled version of a csv map is kept
+def compiled_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".lvl"
+
+def hash_file(path):
+    with open(path, "rb") as data:
+        return hashlib.sha1(data.read()).digest()
+
+# Reads a csv map into (width, height, ids). The map is as wide as its longest row, shorter rows are padded
+# with empty tiles.
+def parse_csv(csv_path):
+    with open(csv_path) as data:
+        rows = [row for row in csv.reader(data, delimiter=",")]
+
+    width = max((len(row) for row in rows), default=0)
+    ids = array.array("h")
+    for row in rows:
+        values = [int(value) if value.strip() else EMPTY for value in row]
+        values += [EMPTY] * (width - len(values))
+        ids.extend(values)
+    return width, len(rows), ids
+
+# Writes the compiled level, going through a temp file so a half written file is never loaded.
+# Every writer gets its own temp file, so processes compiling the same map at once (like playtest.py's
+# workers starting up) can't truncate each other's file before it is moved into place.
+def write_compiled(path, width, height, ids, mtime_ns, digest):
+    data = array.array("h", ids)
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                         suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, width, height, mtime_ns, digest))
+            out.write(data.tobytes())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+# Reads the header of a compiled level, or None if it is missing or not one we can read
+def read_header(path):
+    try:
+        with open(path, "rb") as data:
+            header = data.read(HEADER.size)
+    except OSError:
+        return None
+
+    if len(header) != HEADER.size:
+        return None
+    magic, version, width, height, mtime_ns, digest = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return None
+    return width, height, mtime_ns, digest
+
+# Memory maps a compiled level, or None if the file isn't exactly as long as its header says (cut short by a
+# crash or a full disk, or with junk on the end), so it gets compiled again
+def map_compiled(path, width, height):
+    with open(path, "rb") as data:
+        if os.fstat(data.fileno()).st_size != HEADER.size + width * height * 2:
+            return None
+        mapped = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+
+    ids = memoryview(mapped)[HEADER.size:HEADER.size + width * height * 2].cast("h")
+    if sys.byteorder != "little":
+        ids = array.array("h", ids)
+        ids.byteswap()
+    return ids
+
+# Loads a csv map through its compiled .lvl file, compiling it first if it is missing or out of date
+def load_level(csv_path):
+    path = compiled_path(csv_path)
+    mtime_ns = os.stat(csv_path).st_mtime_ns
+    header = read_header(path)
+
+    if header is not None:
+        width, height, compiled_mtime, compiled_digest = header
+        ids = map_compiled(path, width, height)
+        if ids is not None and compiled_mtime == mtime_ns:
+            return Level(width, height, ids)
+
+        # The csv was touched, but it only needs compiling again if what's in it changed
+        if ids is not None and hash_file(csv_path) == compiled_digest:
+            digest = compiled_digest
+            try:
+                write_compiled(path, width, height, ids, mtime_ns, digest)
+            except OSError:
+                pass
+            return Level(width, height, ids)
+
+    width, height, ids = parse_csv(csv_path)
+    try:
+        write_compiled(path, width, height, ids, mtime_ns, hash_file(csv_path))
+    except OSError:
+        # Can't write next to the map (read only install, etc.), so just use the parsed ids
+        return Level(width, height, ids)
+    compiled = map_compiled(path, width, height)
+    return Level(width, height, ids if compiled is None else compiled)
@@ -1,40 +1,132 @@
 # MAIN FILE 
 
+# Importing this file doesn't open a window or load anything, startup() does that (and it runs by itself
+# the first time something needs the display, like loading sprites).
+import time
+IMPORT_START = time.perf_counter()
+
 import os
 from os import listdir
 from os.path import isfile, join
 import math
 import random
+import argparse
+from contextlib import contextmanager
 import pygame
-from pygame.locals import *
-from tiles import *
-
-# Start Pygame
-pygame.init()
-
-# Window Title
-pygame.display.set_caption("Goblin Trot")
+from tiles import Tile, TileMap, SolidBlock, collide_terrain
+import assets
+import atlas
+import animation
+from animation import AnimationClock
+from render import DirtyRenderer, ScaledRenderer, screen_rect
+from profiler import FrameProfiler
+from broadphase import SweepAndPrune
+from background import Background, BackgroundLayer
+from navigation import NavigationGraph
+from governor import FrameGovernor
 
 # Main Macros
 BG_COLOR = (255, 255, 255)
 WIDTH, HEIGHT = 1000, 800
-CANVAS_WIDTH, CANVAS_HEIGHT = 4800, 1200
 FPS = 60
 PLAYER_VEL = 5
-
-# Sets window display size
-window = pygame.display.set_mode((WIDTH, HEIGHT))
+JUMP_VEL = -6
+SIM_DT = 1 / FPS # The simulation always advances in steps of one 60 FPS tick
+MAX_TICKS_PER_FRAME = 5 # Stops a long stall from trying to catch up forever
+INTERPOLATE = True # Draws between the last two ticks so movement stays smooth when ticks and frames don't line up
+STREAM_LEVELS = False # Only keeps the map chunks near the camera loaded (for maps too big to load at once)
+CHASING_ENEMIES = False # Enemies chase the player across platforms (see navigation.py) instead of patrolling
+SLEEP_FAR_ENTITIES = True # Enemies and runes far from the camera stop updating and catch up when it comes back
+BATCH_ENTITIES = False # Runs enemies and runes as numpy arrays (for levels with thousands of them, needs numpy)
+ADAPTIVE_QUALITY = True # Lowers the quality (see governor.py) while frames take longer than the machine has for them
+DIRTY_RECTS = True # Only update the parts of the window that changed when the camera is still
+PRINT_STARTUP_REPORT = False # Prints how long each part of starting up took once the first frame is drawn
+
+# The game window, made by startup()
+window = None
+
+# Times how long each part of starting the game takes, up to the first frame on screen
+class StartupReport():
+    def __init__(self):
+        self.times = {}
+        self.done = False
+
+    # Adds the time spent inside the with block to a part (only until the first frame)
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if not self.done:
+                self.times[name] = self.times.get(name, 0) + time.perf_counter() - start
+
+    # Called once the first frame is drawn, records the total time since main.py started importing
+    def first_frame(self):
+        if not self.done:
+            self.times["first_frame"] = time.perf_counter() - IMPORT_START
+            self.done = True
+
+    def report(self):
+        lines = ["Startup times:"]
+        for name in ("import", "init", "assets", "map", "first_frame"):
+            if name in self.times:
+                lines.append(f"  {name:12} {self.times[name] * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+startup_report = StartupReport()
+
+# Starts pygame and opens the window. Safe to call more than once, it only does anything the first time.
+# headless uses SDL's dummy video driver, so there's no real window (for tools, benchmarks and build boxes).
+def startup(headless=False):
+    global window
+    if window is not None:
+        return window
+
+    with startup_report.measure("init"):
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+        # Start Pygame
+        pygame.init()
+
+        # Window Title
+        pygame.display.set_caption("Goblin Trot")
+
+        # Sets window display size
+        window = pygame.display.set_mode((WIDTH, HEIGHT))
+    return window
+
+# Anything that loads an image before startup() was called starts the game up first
+assets.display_starter = startup
 
 # Gets the flipped version of sprites that have a direction (ie. left or right)
 def flip(sprites):
     return [pygame.transform.flip(sprite, True, False) for sprite in sprites]
 
-# Loads the sprite sheets from the given directory and returns a dictionary of sprites
+# Builds the collision mask for every frame so entities don't have to rebuild them each tick
+def get_masks(sprites):
+    return [pygame.mask.from_surface(sprite) for sprite in sprites]
+
+# Loads the sprite sheets from the given directory and returns a dictionary of sprites,
+# along with a matching dictionary of masks (same names, same frame order).
+# Results are shared through the asset cache, so every enemy/rune/health uses the same frames.
 def load_sprite_sheets(dir1, dir2, width, height, direction=False):
+    startup()
     path = join("assets", dir1, dir2)
+    with startup_report.measure("assets"):
+        return assets.cache.get((path, (width, height), direction),
+                                lambda: build_sprite_sheets(path, width, height, direction))
+
+# Slices every sprite sheet in the directory into frames (only called on an asset cache miss).
+# The frames, flipped ones included, are packed onto one atlas page of their own, so the page goes away with
+# the cache entry when it is evicted (and the cache counts the page, see assets.asset_size).
+def build_sprite_sheets(path, width, height, direction):
     images = [f for f in listdir(path) if isfile(join(path, f))]
 
     all_sprites = {}
+    all_masks = {}
 
     for image in images:
         sprite_sheet = pygame.image.load(join(path, image)).convert_alpha()
@@ -52,17 +144,32 @@ def load_sprite_sheets(dir1, dir2, width, height, direction=False):
             all_sprites[image.replace(".png", "") + "_left"] = flip(sprites)
         else:
             all_sprites[image.replace(".png", "")] = sprites
+
+    names = list(all_sprites)
+    for name in names:
+        all_masks[name] = get_masks(all_sprites[name])
+
+    _, frames = atlas.pack_page([sprite for name in names for sprite in all_sprites[name]])
+    for name in names:
+        count = len(all_sprites[name])
+        all_sprites[name], frames = frames[:count], frames[count:]
     
-    return all_sprites
+    return all_sprites, all_masks
 
 # Gets the block from the terrain sprite sheet, returns a surface with the block image.
+# Terrain.png and each cut block are only made once and then shared through the asset cache.
 def get_block(size, startX, startY):
+    startup()
     path = join("assets", "Terrain", "Terrain.png")
-    image = pygame.image.load(path).convert_alpha()
-    surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
-    rect = pygame.Rect(startX, startY, size, size)
-    surface.blit(image, (0, 0), area=rect)
-    return surface
+
+    def loader():
+        image = assets.load_image(path)
+        surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
+        rect = pygame.Rect(startX, startY, size, size)
+        surface.blit(image, (0, 0), area=rect)
+        return surface
+
+    return assets.cache.get((path, (size, size), (startX, startY)), loader)
 
 # Handles health display and damage for player and enemies. 
 class Health:
@@ -70,7 +177,7 @@ class Health:
         self.rect = pygame.Rect(x, y, 32, 32)
         self.max_health = maxHealth
         self.current_health = maxHealth
-        self.sprites = load_sprite_sheets("Utility", "Health", 32, 32, False)
+        self.sprites, _ = load_sprite_sheets("Utility", "Health", 32, 32, False)
         self.sprite_name = "life"
         self.frame = self.current_health
         self.entity = entity
@@ -90,15 +197,24 @@ class Health:
             self.rect.y = self.entity.rect.y + self.offset_y
 
 
-    # Draws the health display on the canvas and determines which frame to display based on current health
-    def draw(self, canvas, offset_x=0, offset_y=0):
-        
+    # Determines which frame to display based on current health
+    def get_sprite(self):
         frame_index = self.max_health - self.current_health
 
         if frame_index >= len(self.sprites[self.sprite_name]):
             frame_index = len(self.sprites[self.sprite_name]) - 1
 
-        sprite = self.sprites[self.sprite_name][frame_index]
+        return self.sprites[self.sprite_name][frame_index]
+
+    # Gets where the health display is drawn on the screen
+    def get_screen_rect(self, offset_x=0, offset_y=0):
+        if self.fixed_pos:
+            offset_x, offset_y = 0, 0
+        return screen_rect(self.get_sprite(), self.rect.x, self.rect.y, offset_x, offset_y)
+
+    # Draws the health display on the canvas
+    def draw(self, canvas, offset_x=0, offset_y=0):
+        sprite = self.get_sprite()
         
         if self.fixed_pos:
             canvas.blit(sprite, (self.rect.x, self.rect.y))
@@ -110,18 +226,23 @@ class Player(pygame.sprite.Sprite):
 
     COLOR = (255, 0, 0)
     GRAVITY = 1
-    SPRITES = load_sprite_sheets("MainCharacter", "GoblinBro", 32, 32, True)
+    SPRITES = None # Loaded when the first player is made
+    MASKS = None
     ANIMATION_DELAY = 5
     
     # Initializes player qualities
     def __init__(self, x, y, width, height, name=None):
         super().__init__()
+        if Player.SPRITES is None:
+            Player.SPRITES, Player.MASKS = load_sprite_sheets("MainCharacter", "GoblinBro", 32, 32, True)
         self.rect = pygame.Rect(x, y, width, height)
         self.x_vel = 0
         self.y_vel = 0
         self.mask = None
         self.direction = "left"
         self.animation_count = 0
+        self.sprite_sheet_name = None
+        self.sprite_index = 0
         self.fall_count = 0
         self.jump_count = 0
         self.gravity_enabled = True
@@ -247,15 +368,17 @@ class Player(pygame.sprite.Sprite):
         # print(f"[DEBUG] Sheet: {sprite_sheet_name}, Frame: {sprite_index}/{len(sprites)}, Anim Count: {self.animation_count}, Y_Vel: {self.y_vel}")
         
         self.sprite = sprites[sprite_index]
+        self.sprite_sheet_name = sprite_sheet_name
+        self.sprite_index = sprite_index
 
         self.animation_count += 1
 
         self.update()
 
-    # Update function that sets rect position and mask
+    # Update function that sets rect position and looks up the precomputed mask
     def update(self):
         self.rect.topleft = (self.rect.x, self.rect.y) 
-        self.mask = pygame.mask.from_surface(self.sprite)  
+        self.mask = self.MASKS[self.sprite_sheet_name][self.sprite_index]
 
     # Draws the player sprite on the canvas
     def draw(self, canvas, offset_x, offset_y):
@@ -269,6 +392,8 @@ class Player(pygame.sprite.Sprite):
 class Enemy(pygame.sprite.Sprite):
     
     ANIMATION_DELAY = 5
+    CHASE_SPEED = 2
+    HOP_SPEED = 6
     
     # Initializes enemy qualities
     def __init__(self, x, y, width, height, patrol_distance=200):
@@ -281,7 +406,15 @@ class Enemy(pygame.sprite.Sprite):
         self.direction = "left"
         self.animation_count = 0
         self.sprite = None
-        self.sprites = load_sprite_sheets("Enemies", "EvilWizard", 32, 32, True)
+        self.sprite_sheet_name = None
+        self.sprite_index = 0
+        # Off when the enemy is too far off screen for the quality tier to animate it (see Game.step_enemies)
+        self.animate = True
+        self.sprites, self.masks = load_sprite_sheets("Enemies", "EvilWizard", 32, 32, True)
+        # The enemy's count starts over whenever it turns around, so it keeps its own count
+        # and only looks its frames up in the shared animations
+        self.animations = {name: animation.get(("Enemies", "EvilWizard", 32, 32, True), name, self.ANIMATION_DELAY,
+                                               self.sprites[name], self.masks[name]) for name in self.sprites}
         self.hit = False
         self.hit_count = 0
         self.can_move = True
@@ -296,6 +429,11 @@ class Enemy(pygame.sprite.Sprite):
         self.patrol_right_bound = x + patrol_distance
         self.patrol_left_bound = x
 
+        # Chasing (see chase), only when the game gives the enemy a navigation graph and a target
+        self.navigation = None
+        self.target = None
+        self.hop = None
+
     # Adjusts enemies rect position based on change in x
     def move(self, dx):
         self.rect.x += dx
@@ -343,12 +481,57 @@ class Enemy(pygame.sprite.Sprite):
             self.x_vel = abs(self.x_vel)  # Ensure moving right
             self.animation_count = 0
 
+    # Follows the navigation graph towards the target: walks to where the next link leaves its platform,
+    # then hops along the link. Goes on patrolling while the path is still being searched for (or there isn't one).
+    def chase(self):
+        if self.hop is not None:
+            self.follow_hop()
+            return
+
+        target = self.target
+        path = self.navigation.request((self.rect.centerx, self.rect.bottom), (target.rect.centerx, target.rect.bottom))
+        if path is None:
+            self.patrol()
+            self.move(self.x_vel)
+            return
+
+        goal_x = path[0].from_x if path else target.rect.centerx
+        dx = goal_x - self.rect.centerx
+        speed = self.CHASE_SPEED
+        if path and abs(dx) <= speed:
+            self.rect.centerx = goal_x
+            self.hop = path[0]
+            return
+
+        if dx < 0:
+            self.moveLeft(speed)
+        elif dx > 0:
+            self.moveRight(speed)
+        self.move(max(-speed, min(speed, dx)))
+
+    # Moves along the link being hopped, straight to where it lands
+    def follow_hop(self):
+        link = self.hop
+        dx = link.to_x - self.rect.centerx
+        dy = link.to_segment.y - self.rect.bottom
+        distance = math.hypot(dx, dy)
+        if distance <= self.HOP_SPEED:
+            self.rect.centerx = link.to_x
+            self.rect.bottom = link.to_segment.y
+            self.hop = None
+        else:
+            self.rect.x += round(dx / distance * self.HOP_SPEED)
+            self.rect.y += round(dy / distance * self.HOP_SPEED)
+
     # Handles enemy loop, inlcuding aliveness, hitness, movement, and health display.
     def loop(self, FPS):
         # Handle patrol movement if alive and can move
         if self.is_alive and self.can_move:
-            self.patrol()
-            self.move(self.x_vel)
+            if self.navigation is not None and self.target is not None:
+                self.chase()
+            else:
+                self.patrol()
+                self.move(self.x_vel)
 
         # Reset hit state after delay
         if self.hit:
@@ -361,6 +544,77 @@ class Enemy(pygame.sprite.Sprite):
         
         self.update_sprite()
 
+    # Does the same as loop(FPS) being called ticks times, without running every tick.
+    # Used to catch an enemy up after it slept while far from the player.
+    def catch_up(self, ticks, FPS):
+        # Being hit only lasts about a second, so those ticks are just run
+        while self.hit and ticks > 1:
+            self.loop(FPS)
+            ticks -= 1
+        if ticks <= 0:
+            return
+
+        # The last tick is run for real, so the sprite, mask and health bar end up right
+        ticks -= 1
+        if self.is_alive and self.can_move and not self.hit:
+            self.skip_patrol(ticks)
+        else:
+            self.animation_count += ticks
+        self.loop(FPS)
+
+    # One tick of patrolling, the same as loop() does for an enemy that isn't hit, without the sprite
+    def patrol_tick(self):
+        self.patrol()
+        self.move(self.x_vel)
+        self.animation_count += 1
+
+    # Moves the patrol ahead by ticks.
+    # Once the enemy turns around at the left bound, it walks right for n ticks and back left for m ticks
+    # and is where it started again, so everything after that first turn is worked out from the leftover
+    # part of the last lap instead of tick by tick.
+    def skip_patrol(self, ticks):
+        speed = abs(self.x_vel)
+        left_bound, right_bound = self.patrol_left_bound, self.patrol_right_bound
+
+        # Runs ticks until the enemy turns around at the left bound
+        while ticks > 0:
+            start = self.rect.x
+            self.patrol_tick()
+            ticks -= 1
+            if start <= left_bound < self.rect.x:
+                break
+            if speed == 0:
+                # Standing still, only the animation moves (it restarts every tick on a bound)
+                if start >= right_bound or start <= left_bound:
+                    return
+                self.animation_count += ticks
+                return
+        if ticks == 0:
+            return
+
+        n = math.ceil((right_bound - start) / speed)
+        m = math.ceil((start + n * speed - left_bound) / speed)
+        phase = ticks % (n + m)
+        if phase < n:
+            self.rect.x = start + (phase + 1) * speed
+            self.x_vel = speed
+            self.direction = "right"
+            self.animation_count = phase + 1
+        else:
+            self.rect.x = start + (2 * n - phase - 1) * speed
+            self.x_vel = -speed
+            self.direction = "left"
+            self.animation_count = phase - n + 1
+
+    # The area the enemy can be anywhere in while it patrols
+    def activity_rect(self):
+        width = max(sprite.get_width() for sprites in self.sprites.values() for sprite in sprites)
+        height = max(sprite.get_height() for sprites in self.sprites.values() for sprite in sprites)
+        speed = abs(self.x_vel)
+        left = min(self.rect.x, self.patrol_left_bound) - speed
+        right = max(self.rect.x, self.patrol_right_bound) + speed + max(width, self.rect.width)
+        return pygame.Rect(left, self.rect.y, right - left, max(height, self.rect.height))
+
     # Updates sprite based on enemy state
     def update_sprite(self):
         sprite_sheet = "moving"  # Default animation
@@ -371,19 +625,26 @@ class Enemy(pygame.sprite.Sprite):
         elif self.hit:
             sprite_sheet = "hit"
 
+        # Keeps the last frame and mask, the count still moves on so the right frame shows once it's close
+        if not self.animate and self.sprite is not None:
+            self.animation_count += 1
+            return
+
         # Adds proper directional name for sprite
         sprite_sheet_name = sprite_sheet + "_" + self.direction
-        sprites = self.sprites[sprite_sheet_name]
-        sprite_index = (self.animation_count // self.ANIMATION_DELAY) % len(sprites) # Iteration through frames 
+        sprite_animation = self.animations[sprite_sheet_name]
+        sprite_index = sprite_animation.index_at(self.animation_count) # Iteration through frames 
 
-        self.sprite = sprites[sprite_index]
+        self.sprite = sprite_animation.frames[sprite_index]
+        self.sprite_sheet_name = sprite_sheet_name
+        self.sprite_index = sprite_index
         self.animation_count += 1
         self.update()
 
-    # Updates enemy rect position and mask
+    # Updates enemy rect position and looks up the precomputed mask
     def update(self):
         self.rect = self.sprite.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.sprite)
+        self.mask = self.masks[self.sprite_sheet_name][self.sprite_index]
 
     # Draws the enemy sprite on the canvas
     def draw(self, canvas, offset_x, offset_y):
@@ -397,10 +658,12 @@ class Enemy(pygame.sprite.Sprite):
 class Object(pygame.sprite.Sprite):
 
     # Intialize object qualities
-    def __init__(self, x, y, width, height, name=None):
+    # blank: start with an empty image of its size (objects whose image comes from an animation don't need one)
+    def __init__(self, x, y, width, height, name=None, blank=True):
         super().__init__()
         self.rect = pygame.Rect(x, y, width, height)
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
+        if blank:
+            self.image = pygame.Surface((width, height), pygame.SRCALPHA)
         self.width = width
         self.height = height
         self.name = name
@@ -436,37 +699,65 @@ class Rune(Object):
 
     ANIMATION_DELAY = 3
 
-    # Initializes rune qualities
-    def __init__(self, x, y, width, height):
-        super().__init__(x, y, width, height, "rune")
-        self.rune = load_sprite_sheets("Traps", "Rune", width, height)
-        self.image = self.rune["rune"][0]
-        self.mask = pygame.mask.from_surface(self.image)
-        self.animation_count = 0
-        self.animation_name = "rune"
+    # Initializes rune qualities.
+    # Runes given a game's AnimationClock all run off it and don't need stepping one by one,
+    # a rune without one gets its own clock that loop() moves on.
+    def __init__(self, x, y, width, height, clock=None):
+        super().__init__(x, y, width, height, "rune", blank=False)
+        self.sheet = ("Traps", "Rune", width, height)
+        self.rune, self.rune_masks = load_sprite_sheets(*self.sheet)
+        self.owns_clock = clock is None
+        self.clock = AnimationClock() if clock is None else clock
+        self.phase = -self.clock.ticks
+        self.idle()
+        self.rect = self.image.get_rect(topleft=(self.rect.x, self.rect.y))
 
     # Handles the idle state of rune
     def idle(self):
         self.animation_name = "rune"
+        frames = self.rune[self.animation_name]
+
+        # The count goes one past the last frame before starting over, so the first frame shows a little longer
+        self.animation = animation.get(self.sheet, self.animation_name, self.ANIMATION_DELAY, frames,
+                                       self.rune_masks[self.animation_name], self.ANIMATION_DELAY * (len(frames) + 1))
+
+    # Where the rune is in its animation. Setting it moves the rune's phase against the clock.
+    @property
+    def animation_count(self):
+        return (self.clock.ticks + self.phase) % self.animation.period
+
+    @animation_count.setter
+    def animation_count(self, count):
+        self.phase = count - self.clock.ticks
 
-    # Handles the animation of the rune
+    # The frame the last tick showed
+    @property
+    def sprite_index(self):
+        return self.animation.index_at(self.animation_count - 1)
+
+    @property
+    def image(self):
+        return self.animation.frames[self.sprite_index]
+
+    @property
+    def mask(self):
+        return self.animation.masks[self.sprite_index]
+
+    # Handles the animation of the rune (only needed when it has its own clock)
     def loop(self):
-        
-        sprites = self.rune[self.animation_name]
-        sprite_index = (self.animation_count //
-                        self.ANIMATION_DELAY) % len(sprites)
-            
-        self.image = sprites[sprite_index]
-        self.animation_count += 1
-        self.update()
+        if self.owns_clock:
+            self.clock.advance()
 
-        if self.animation_count // self.ANIMATION_DELAY > len(sprites):
-            self.animation_count = 0
+    # Does the same as loop() being called ticks times. A rune on a shared clock is always up to date.
+    def catch_up(self, ticks):
+        if self.owns_clock and ticks > 0:
+            self.clock.advance(ticks)
 
-    # Updates rune rect position and mask
-    def update(self):
-        self.rect = self.image.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.image)  # Update the mask
+    # The area the rune covers (it never moves)
+    def activity_rect(self):
+        width = max(image.get_width() for images in self.rune.values() for image in images)
+        height = max(image.get_height() for images in self.rune.values() for image in images)
+        return pygame.Rect(self.rect.x, self.rect.y, max(width, self.rect.width), max(height, self.rect.height))
 
 # Class for Win Object in the game
 class WinObject(Object):
@@ -476,51 +767,56 @@ class WinObject(Object):
         super().__init__(x, y, width, height, "win")
 
         # Loads the win image (only need to draw to canvas at end, no other functions neccesary)
-        self.image = pygame.image.load(join("assets", "Utility", "Win", "youwin!.png"))
+        startup()
+        self.image = assets.load_image(join("assets", "Utility", "Win", "youwin!.png"), alpha=False)
 
 
-# Makes the background from one tile repeated over the whole canvas
+# Makes the background from one tile repeated over the whole canvas (drawn once, it stays put on the screen)
 def get_background(name):
-    image = pygame.image.load(join("assets", "Background", name))
-    _, _, width, height = image.get_rect()
-
-    tiles = []
-
-    # Iterate through every tile size on the canvas and puts the image to each tile, making infinte background.
-    for i in range(WIDTH // width + 1):
-        for j in range(HEIGHT // height + 1):
-            pos = [i * width, j * height]
-            tiles.append(pos)
+    startup()
+    image = assets.load_image(join("assets", "Background", name), alpha=False)
+    return Background([BackgroundLayer(image)], (WIDTH, HEIGHT))
 
-    return tiles, image
-
-# Draws Everything onto the screen
-def draw(canvas, window, background, bg_image, player, objects, runes, enemies, tilemap, offset_x, offset_y):
-    canvas.fill((0, 0, 0, 0))
+# Draws Everything onto the canvas (only inside its clip rect, if it has one)
+# With a scaler (a render.ScaledRenderer), the canvas is the screen at scaler.scale and everything is drawn shrunk.
+def draw_scene(canvas, background, player, objects, runes, enemies, tilemap, offset_x, offset_y, scaler=None):
+    scale = 1 if scaler is None else scaler.scale
 
-    # Blits every tile to the background
-    for tile in background:
-        canvas.blit(bg_image, tile)
+    # The background covers the whole canvas, so nothing needs clearing first
+    if scaler is None:
+        background.draw(canvas, offset_x, offset_y)
+    else:
+        background.scaled(scale).draw(canvas, offset_x * scale, offset_y * scale)
 
     # Draws the whole tilemap based off of the cvs stuff in tiles.py
-    tilemap.draw_map(canvas, offset_x, offset_y)
+    tilemap.draw_map(canvas, offset_x, offset_y, scale)
 
 
-    # Draws all objects
+    # Everything on top of the map is drawn in one batch, straight from the atlas pages
+    sprites = []
+
+    # Draws all objects (tiles are already drawn by the tilemap)
     for obj in objects:
-        if obj not in tilemap.get_tiles():
-            obj.draw(canvas, offset_x, offset_y)
+        if not isinstance(obj, Tile):
+            sprites.append((obj.image, (obj.rect.x - offset_x, obj.rect.y - offset_y)))
 
     # Draws all runes
     for rune in runes:
-        rune.draw(canvas, offset_x, offset_y)
+        sprites.append((rune.image, (rune.rect.x - offset_x, rune.rect.y - offset_y)))
 
-    # Draws all enemies
-    for enemy in enemies:
-        enemy.draw(canvas, offset_x, offset_y)
+    # Draws all enemies, then the player, each with its health display
+    for entity in enemies + [player]:
+        sprites.append((entity.sprite, (entity.rect.x - offset_x, entity.rect.y - offset_y)))
+        health = entity.health_display
+        sprites.append((health.get_sprite(), health.get_screen_rect(offset_x, offset_y).topleft))
 
-    # Draws the player
-    player.draw(canvas, offset_x, offset_y)
+    if scaler is not None:
+        sprites = [(scaler.shrink(sprite), (round(x * scale), round(y * scale))) for sprite, (x, y) in sprites]
+    canvas.blits(atlas.blit_list(sprites), doreturn=False)
+
+# Draws Everything onto the screen
+def draw(canvas, window, background, player, objects, runes, enemies, tilemap, offset_x, offset_y):
+    draw_scene(canvas, background, player, objects, runes, enemies, tilemap, offset_x, offset_y)
 
     # Draws canvas (everything) to the window
     window.blit(canvas, (0, 0))
@@ -529,6 +825,38 @@ def draw(canvas, window, background, bg_image, player, objects, runes, enemies,
     # Updates the display
     pygame.display.update()
 
+# Gets the area covered by the player's rect and mask, since the sprite is bigger than the rect
+def mask_rect(player):
+    rect = player.rect.copy()
+    if player.mask:
+        rect.union_ip(pygame.Rect(player.rect.topleft, player.mask.get_size()))
+    return rect
+
+# The terrain the player touches: the merged solid blocks near it (in csv order), then the first see-through tile
+# the tile map's chunk masks say it touches. Each is tested as it is reached, so snapping to one counts for the next.
+def touched_terrain(player, tilemap):
+    for block in tilemap.colliders_in_rect(mask_rect(player)):
+        if collide_terrain(player, block):
+            yield block
+    if player.mask is not None:
+        tile = tilemap.tile_touching(player.mask, player.rect.topleft)
+        if tile is not None:
+            yield tile
+
+# Lists everything that moves or animates as (key, state, screen rect) for the dirty rect renderer
+def get_drawables(player, objects, runes, enemies, offset_x, offset_y):
+    drawables = []
+
+    for obj in objects + runes:
+        drawables.append((id(obj), obj.image, screen_rect(obj.image, obj.rect.x, obj.rect.y, offset_x, offset_y)))
+
+    for entity in enemies + [player]:
+        drawables.append((id(entity), entity.sprite, screen_rect(entity.sprite, entity.rect.x, entity.rect.y, offset_x, offset_y)))
+        health = entity.health_display
+        drawables.append((id(health), health.get_sprite(), health.get_screen_rect(offset_x, offset_y)))
+
+    return drawables
+
 # Handles vertical collisions between the player, objects, and tiles.
 def handle_vertical_collision(player, objects, tilemap, dy):
     collided_objects = []
@@ -554,22 +882,20 @@ def handle_vertical_collision(player, objects, tilemap, dy):
             # Adds collided object to list    
             collided_objects.append(obj)
 
-    # Checks same collisions for tiles in tile map because they are different
-    for tile in tilemap.tiles:
-        if pygame.sprite.collide_mask(player, tile):
-
-            horizontal_overlap = min(player.rect.right - tile.rect.left,
-                                    tile.rect.right - player.rect.left)
-            
-            if horizontal_overlap > 10:
-                if dy > 0:  # Player is falling
-                    player.rect.bottom = tile.rect.top
-                    player.landed()  # Reset jump count and set player on ground
-                elif dy < 0:  # Player is jumping upwards
-                    player.rect.top = tile.rect.bottom
-                    player.hit_head()  # Handle hitting the ceiling
-            
-            collided_objects.append(tile)
+    # Checks same collisions for the tile map's terrain because they are different
+    for tile in touched_terrain(player, tilemap):
+        horizontal_overlap = min(player.rect.right - tile.rect.left,
+                                tile.rect.right - player.rect.left)
+        
+        if horizontal_overlap > 10:
+            if dy > 0:  # Player is falling
+                player.rect.bottom = tile.rect.top
+                player.landed()  # Reset jump count and set player on ground
+            elif dy < 0:  # Player is jumping upwards
+                player.rect.top = tile.rect.bottom
+                player.hit_head()  # Handle hitting the ceiling
+        
+        collided_objects.append(tile)
 
     return collided_objects
 
@@ -608,12 +934,11 @@ def collide(player, objects, tilemap, dx):
                 collided_object = obj
                 break
 
-    # Checks all tiles
-    for tile in tilemap.tiles:
-        if pygame.sprite.collide_mask(player, tile):
-            if player.rect.colliderect(tile.rect):
-                collided_object = tile
-                break
+    # Checks only the terrain near the player
+    for tile in touched_terrain(player, tilemap):
+        if player.rect.colliderect(tile.rect):
+            collided_object = tile
+            break
 
     # Fixes player x position if collision occured         
     player.move(-dx, 0)
@@ -621,10 +946,25 @@ def collide(player, objects, tilemap, dx):
     return collided_object
 
 
+# The keys held during one tick. Lets the game run from injected input instead of the keyboard.
+class InputState():
+    def __init__(self, left=False, right=False, jump=False):
+        self.left = left
+        self.right = right
+        self.jump = jump  # Jump key was pressed (KEYDOWN) this tick
+
+    # Reads left/right from the real keyboard
+    @classmethod
+    def from_keyboard(cls, jump=False):
+        keys = pygame.key.get_pressed()
+        return cls(keys[pygame.K_LEFT], keys[pygame.K_RIGHT], jump)
+
 # Handles control over player movement as well as factoring in collision with objects and tiles.
-def handle_movement(player, objects, tilemap):
+# Reads the keyboard unless inputs (an InputState) are given.
+def handle_movement(player, objects, tilemap, inputs=None):
     # Pygame function that can tell if keys are pressed, returns as boolean
-    keys = pygame.key.get_pressed()
+    if inputs is None:
+        inputs = InputState.from_keyboard()
 
     player.x_vel = 0
 
@@ -632,9 +972,9 @@ def handle_movement(player, objects, tilemap):
         collide_left = collide(player, objects, tilemap, -PLAYER_VEL * 2)
         collide_right = collide(player, objects, tilemap, PLAYER_VEL * 2)
 
-        if keys[pygame.K_LEFT] and not collide_left:
+        if inputs.left and not collide_left:
             player.moveLeft(PLAYER_VEL)
-        if keys[pygame.K_RIGHT] and not collide_right:
+        if inputs.right and not collide_right:
             player.moveRight(PLAYER_VEL)         
     else: # Player cannot move when hit, but still has collisions
             
@@ -645,7 +985,7 @@ def handle_movement(player, objects, tilemap):
     vertical_collide = handle_vertical_collision(player, objects, tilemap, player.y_vel)
     to_check = [collide_left, collide_right, *vertical_collide]
     for obj in to_check:
-        if type(obj) == Tile:
+        if isinstance(obj, (Tile, SolidBlock)):
             break
         if obj and obj.name == "rune":
             player.makeHit()
@@ -653,123 +993,458 @@ def handle_movement(player, objects, tilemap):
             player.makeHit()
 
 
-# Main Function that handles everything that happens, including window, time, sprites, and logic.
-def main(window):
-    
-    # Handles time in pygame 
-    clock = pygame.time.Clock()
-
-    # Background 
-    background, bg_image = get_background("purblueBG.png")
-
-    # Block pixel size
-    block_size = 96
-
-    # Player 
-    player = Player(45, 1650, 50, 50)
-    JUMP_VEL = -6
-
-    # Runes
-    rune = Rune(3 * block_size + 15, 17 * block_size + 20, 32, 64)
-    rune2 = Rune(500, HEIGHT - block_size - 300, 32, 64)
-    rune3 = Rune(46 * block_size + 15, 10 * block_size + 30, 32, 64)
-    rune4 = Rune(45 * block_size + 15, 10 * block_size + 30, 32, 64)
-    rune5 = Rune(24 * block_size, 8 * block_size, 32, 64)
-    rune6 = Rune(25 * block_size, 15.25 * block_size, 32, 64)
-    rune7 = Rune(30 * block_size, 5 * block_size, 32, 64)
-    rune8 = Rune(40 * block_size, -1 * block_size, 32, 64)
-    rune9 = Rune(41 * block_size, 8 * block_size, 32, 64)
-    rune10 = Rune(44 * block_size, 13 * block_size + 15, 32, 64)
-
-    # Enemies
-    enemy1 = Enemy(8 * block_size, 12.4 * block_size, 32, 32, 5.25 * block_size)
-    enemy2 = Enemy(28 * block_size, 8.4 * block_size, 32, 32, 6.25 * block_size)
-    enemy3 = Enemy(35 * block_size, 16.4 * block_size, 32, 32, 3.25 * block_size)
-    enemy4 = Enemy(38 * block_size, 12.4 * block_size, 32, 32, 4.25 * block_size)
-
-    # Win Object
-    winObject = WinObject(47 * block_size, 15.35 * block_size, 32, 32)
-    
-    # Lists of runes, enemies, and objects
-    runes = [rune, rune2, rune3, rune4, rune5, rune6, rune7, rune8, rune9, rune10]
-    enemies = [enemy1, enemy2, enemy3, enemy4]
-    objects = [winObject] + runes
-
-    
-    # Entire canvas used for tilemap
-    canvas = pygame.surface.Surface((CANVAS_WIDTH, CANVAS_HEIGHT))
-
-    # Offset to have camera follow player
-    offset_x, offset_y = 0, 0
-
-    # Loads the tilemap from the csv file
-    tilemap = TileMap('GoblinBroMap1.csv')
+# Holds one level's state and advances it one tick at a time.
+# Nothing in here touches the clock or the keyboard, so it can be stepped as fast as the CPU allows.
+class Game():
 
-    # Keeps camera boundaries in place to fit tilemap
+    # Keeps camera boundaries in place to fit tilemap (the right limit comes from the map's width)
     CAMERA_BOTTOM_LIMIT = 1100
-    CAMERA_RIGHT_LIMIT = 3800
     CAMERA_LEFT_LIMIT = 0
 
-    run = True
-
-    # Loop for while game is running
-    while run:
+    # How far outside the screen batched enemies and runes still get collisions and drawing
+    ACTIVE_MARGIN = 256
+
+    # tilemap can be an already loaded TileMap of level to reuse (the game never changes its tiles)
+    def __init__(self, level="GoblinBroMap1.csv", streaming=STREAM_LEVELS, batched=BATCH_ENTITIES, sleeping=SLEEP_FAR_ENTITIES,
+                 tilemap=None, chasing=CHASING_ENEMIES):
+
+        # Background 
+        self.background = get_background("purblueBG.png")
+
+        # Block pixel size
+        block_size = 96
+
+        # Player 
+        self.player = Player(45, 1650, 50, 50)
+
+        # Every rune plays off the same clock, which step_runes moves on once a tick
+        self.animation_clock = AnimationClock()
+        clock = self.animation_clock
+
+        # Runes
+        rune = Rune(3 * block_size + 15, 17 * block_size + 20, 32, 64, clock)
+        rune2 = Rune(500, HEIGHT - block_size - 300, 32, 64, clock)
+        rune3 = Rune(46 * block_size + 15, 10 * block_size + 30, 32, 64, clock)
+        rune4 = Rune(45 * block_size + 15, 10 * block_size + 30, 32, 64, clock)
+        rune5 = Rune(24 * block_size, 8 * block_size, 32, 64, clock)
+        rune6 = Rune(25 * block_size, 15.25 * block_size, 32, 64, clock)
+        rune7 = Rune(30 * block_size, 5 * block_size, 32, 64, clock)
+        rune8 = Rune(40 * block_size, -1 * block_size, 32, 64, clock)
+        rune9 = Rune(41 * block_size, 8 * block_size, 32, 64, clock)
+        rune10 = Rune(44 * block_size, 13 * block_size + 15, 32, 64, clock)
+
+        # Enemies
+        enemy1 = Enemy(8 * block_size, 12.4 * block_size, 32, 32, 5.25 * block_size)
+        enemy2 = Enemy(28 * block_size, 8.4 * block_size, 32, 32, 6.25 * block_size)
+        enemy3 = Enemy(35 * block_size, 16.4 * block_size, 32, 32, 3.25 * block_size)
+        enemy4 = Enemy(38 * block_size, 12.4 * block_size, 32, 32, 4.25 * block_size)
+
+        # Win Object
+        self.win_object = WinObject(47 * block_size, 15.35 * block_size, 32, 32)
         
-        # Goes through time
-        clock.tick(FPS)
-
-        # Handles certian events, such as quitting and jumping
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
-            
-            if event.type == pygame.KEYDOWN: # Jumping is easier to handle in main loop than player class
-                if event.key == pygame.K_UP and player.jump_count < 2:
-                    player.jump(JUMP_VEL)
+        # Lists of runes, enemies, and objects
+        self.runes = [rune, rune2, rune3, rune4, rune5, rune6, rune7, rune8, rune9, rune10]
+        self.enemies = [enemy1, enemy2, enemy3, enemy4]
+        self.objects = [self.win_object] + self.runes
+
+        # The runes, enemies and objects that collisions and drawing look at. That's all of them,
+        # unless they are batched, then it's only the ones near the camera.
+        self.active_runes = self.runes
+        self.active_enemies = self.enemies
+        self.active_objects = self.objects
+        self.rune_batch = None
+        self.enemy_batch = None
+        if batched:
+            # Only imported when used, so numpy isn't loaded for normal games
+            from entity_batch import EnemyBatch, RuneBatch
+            self.rune_batch = RuneBatch(self.runes) if self.runes else None
+            self.enemy_batch = EnemyBatch(self.enemies) if self.enemies else None
+        self.enemy_indexes = []
+
+        # Chasing enemies can't be batched, and can go anywhere so they never sleep
+        chasing = chasing and not batched
+
+        # Where each rune and enemy can get to. The ones whose area is far from the camera sleep, and are caught up
+        # on the ticks they missed when they wake (see update_activity). Batches already run everything at once.
+        self.activity = None
+        self.sleeping = {}
+        if sleeping and not batched and not chasing:
+            self.activity = SweepAndPrune()
+            for entity in self.runes + self.enemies:
+                self.activity.add(entity, rect=entity.activity_rect())
+
+        # Boxes of everything that can collide, so only what is near the player gets mask tested
+        self.broadphase = SweepAndPrune()
+        self.broadphase.add(self.win_object, static=True)
+        for entity in self.runes + self.enemies:
+            self.broadphase.add(entity)
+
+        # Per phase timings, off unless turned on (F3 in the game)
+        self.profiler = FrameProfiler()
+
+        # Enemies further than this outside the screen keep their last frame (None animates every enemy, see set_quality)
+        self.animation_margin = None
+
+        # Loads the tilemap from the csv file
+        startup()
+        if tilemap is None:
+            with startup_report.measure("map"):
+                tilemap = TileMap(level, streaming)
+        self.tilemap = tilemap
+
+        # Chasing enemies find their way with a graph of the map's platforms, searched a few paths a tick
+        self.navigation = None
+        if chasing:
+            self.navigation = NavigationGraph(self.tilemap)
+            for enemy in self.enemies:
+                enemy.navigation = self.navigation
+                enemy.target = self.player
+
+        self.camera_right_limit = max(self.CAMERA_LEFT_LIMIT, self.tilemap.tile_map_w - WIDTH)
+
+        # Offset to have camera follow player
+        self.offset_x, self.offset_y = 0, 0
+        self.update_camera()
+
+        self.ticks = 0
+
+        # Positions from before the last tick, used to interpolate drawing
+        self.previous = []
+        self.previous_offset = (0, 0)
+
+    # Whether the player has reached the win object
+    def reached_win(self):
+        return self.player.rect.colliderect(self.win_object.rect)
+
+    # Things whose rect moves during a tick
+    def movers(self):
+        movers = [self.player] + self.active_enemies
+        return movers + [mover.health_display for mover in movers if not mover.health_display.fixed_pos]
+
+    # Runs one tick of the game with the given InputState
+    def step(self, inputs):
+        player = self.player
+        profiler = self.profiler
+        profile = profiler.enabled
+        if profile:
+            start = time.perf_counter()
+
+        self.previous = [(mover, mover.rect.x, mover.rect.y) for mover in self.movers()]
+        self.previous_offset = (self.offset_x, self.offset_y)
+
+        # Jumping is easier to handle here than in the player class
+        if inputs.jump and player.jump_count < 2:
+            player.jump(JUMP_VEL)
 
         # Runs through player loop            
         player.loop(FPS)
+        if profile:
+            start = profiler.lap("player", start)
         
-        # Runs through each rune animation loop
-        for rune in runes:
-            rune.loop()
+        self.update_activity()
+        self.step_runes()
+        if profile:
+            start = profiler.lap("runes", start)
+
+        self.step_enemies()
+        if profile:
+            start = profiler.lap("enemies", start)
 
-        # Runs through each enemy loop
-        for enemy in enemies:
-            enemy.loop(FPS)
+        # Handles player movement and collisions, against only what the broadphase says is close
+        objects, enemies = self.collision_candidates()
+        handle_movement(player, objects, self.tilemap, inputs)
+        if profile:
+            start = profiler.lap("movement", start)
 
-        # Handles player movement and collisions
-        handle_movement(player, objects, tilemap)
         handle_enemy_collisions(player, enemies)
-        
-        # Draws everyting to the canvas!
-        draw(canvas, window, background, bg_image, player, objects, runes, enemies, tilemap, offset_x, offset_y)
+
+        # Hits from the collisions go back into the batch
+        if self.enemy_batch is not None:
+            self.enemy_batch.pull(self.enemies, self.enemy_indexes)
+        if profile:
+            start = profiler.lap("enemy_collisions", start)
+
+        self.update_camera()
+        if profile:
+            profiler.lap("camera", start)
+        self.ticks += 1
+
+    # Objects and enemies that the player could touch this tick.
+    # handle_movement tests the player PLAYER_VEL * 2 to each side and y_vel up or down from where it is,
+    # and handle_enemy_collisions tests it somewhere in between, so that is the area asked for.
+    def collision_candidates(self):
+        if self.rune_batch is not None or self.enemy_batch is not None or self.activity is not None:
+            self.broadphase.sync(self.active_objects + self.active_enemies)
+        else:
+            self.broadphase.update()
+
+        player = self.player
+        area = mask_rect(player)
+        reach = PLAYER_VEL * 2 + 1
+        fall = math.ceil(abs(player.y_vel)) + 1
+        area.union_ip(area.move(0, fall if player.y_vel > 0 else -fall))
+        area.inflate_ip(reach * 2, 2)
+
+        objects = []
+        enemies = []
+        for entity in self.broadphase.query(area):
+            if isinstance(entity, Enemy):
+                enemies.append(entity)
+            else:
+                objects.append(entity)
+        return objects, enemies
+
+    # Wakes the runes and enemies whose area is near the camera, catching them up on the ticks they slept through,
+    # and puts the rest to sleep
+    def update_activity(self):
+        if self.activity is None:
+            return
+
+        awake = self.activity.query(self.active_area())
+        awake_set = set(awake)
+        for entity in self.active_runes + self.active_enemies:
+            if entity not in awake_set:
+                self.sleeping[entity] = self.ticks
+        for entity in awake:
+            since = self.sleeping.pop(entity, None)
+            if since is not None:
+                self.catch_up(entity, self.ticks - since)
+
+        self.active_runes = [entity for entity in awake if isinstance(entity, Rune)]
+        self.active_enemies = [entity for entity in awake if isinstance(entity, Enemy)]
+        self.active_objects = [self.win_object] + self.active_runes
+
+    # Runs the ticks an entity missed while it slept
+    def catch_up(self, entity, ticks):
+        if isinstance(entity, Enemy):
+            entity.catch_up(ticks, FPS)
+        else:
+            entity.catch_up(ticks)
+
+    # Catches every sleeping entity up to now (they stay asleep), for when their real state is needed
+    def catch_up_sleeping(self):
+        for entity, since in self.sleeping.items():
+            self.catch_up(entity, self.ticks - since)
+            self.sleeping[entity] = self.ticks
+
+    # Where batched enemies and runes are close enough to the camera to need their objects
+    def active_area(self):
+        area = pygame.Rect(int(self.offset_x), int(self.offset_y), WIDTH, HEIGHT)
+        return area.inflate(self.ACTIVE_MARGIN * 2, self.ACTIVE_MARGIN * 2)
+
+    # Moves the runes' shared animation clock on, or runs the batch and copies the runes near the camera onto their objects
+    def step_runes(self):
+        self.animation_clock.advance()
+        if self.rune_batch is None:
+            return
+
+        self.rune_batch.step()
+        rune_indexes = self.rune_batch.in_rect(self.active_area())
+        self.rune_batch.sync(self.runes, rune_indexes)
+        self.active_runes = [self.runes[i] for i in rune_indexes]
+        self.active_objects = [self.win_object] + self.active_runes
+
+    # Runs through each awake enemy's loop, or runs the batch and copies the enemies near the camera onto their objects
+    def step_enemies(self):
+        if self.enemy_batch is None:
+            area = self.animation_area()
+            for enemy in self.active_enemies:
+                enemy.animate = area is None or area.colliderect(enemy.rect)
+                enemy.loop(FPS)
+            if self.navigation is not None:
+                self.navigation.update()
+            return
+
+        self.enemy_batch.step(FPS)
+        self.enemy_indexes = self.enemy_batch.in_rect(self.active_area())
+        self.enemy_batch.sync(self.enemies, self.enemy_indexes)
+        self.active_enemies = [self.enemies[i] for i in self.enemy_indexes]
+
+    # Moves the camera to follow the player
+    def update_camera(self):
+        player = self.player
 
         #Offsets X-Camera to the player so that it is centered
         target_offset_x = player.rect.x - WIDTH // 2 + player.rect.width // 2
 
-        offset_x += (target_offset_x - offset_x) * 0.15 # Smoothness 
+        self.offset_x += (target_offset_x - self.offset_x) * 0.15 # Smoothness 
 
         # Changes X-Camera so it does not go beyond right limit
-        offset_x = max(CAMERA_LEFT_LIMIT, min(target_offset_x, CAMERA_RIGHT_LIMIT))
+        self.offset_x = max(self.CAMERA_LEFT_LIMIT, min(target_offset_x, self.camera_right_limit))
 
         # Offsets Y-Camera to the player so that it is centered
         target_offset_y = player.rect.y - HEIGHT // 2 + player.rect.height // 2  
 
-        offset_y += (target_offset_y - offset_y) * 0.15 # Smoothness 
+        self.offset_y += (target_offset_y - self.offset_y) * 0.15 # Smoothness 
 
         # Changes Y-Camera so it does not go beyond ground limit
-        offset_y = min(target_offset_y, CAMERA_BOTTOM_LIMIT)
+        self.offset_y = min(target_offset_y, self.CAMERA_BOTTOM_LIMIT)
+
+        # Loads the map around the camera when streaming
+        self.tilemap.update_stream(pygame.Rect(int(self.offset_x), int(self.offset_y), WIDTH, HEIGHT))
+
+    # Draws the current state of the game to the screen.
+    # alpha is how far between the last tick and the next one this frame is (1 draws the last tick as is).
+    def draw(self, renderer, alpha=1):
+        offset_x, offset_y = self.offset_x, self.offset_y
+        saved = []
+
+        # Moves everything to where it would be between the last two ticks, and puts it back after drawing
+        if alpha < 1:
+            for mover, x, y in self.previous:
+                saved.append((mover, mover.rect.topleft))
+                mover.rect.topleft = (round(x + (mover.rect.x - x) * alpha), round(y + (mover.rect.y - y) * alpha))
+
+            previous_x, previous_y = self.previous_offset
+            offset_x = previous_x + (offset_x - previous_x) * alpha
+            offset_y = previous_y + (offset_y - previous_y) * alpha
+
+        offset_x, offset_y = int(offset_x), int(offset_y)
+        self.render(renderer, offset_x, offset_y)
+
+        for mover, position in saved:
+            mover.rect.topleft = position
+
+    def render(self, renderer, offset_x, offset_y):
+        if isinstance(renderer, ScaledRenderer):
+            renderer.present(self.draw_scene, offset_x, offset_y)
+        elif DIRTY_RECTS:
+            drawables = get_drawables(self.player, self.active_objects, self.active_runes, self.active_enemies, offset_x, offset_y)
+            renderer.present(self.draw_scene, drawables, offset_x, offset_y)
+        else:
+            draw(renderer.canvas, renderer.window, self.background, self.player, self.active_objects,
+                 self.active_runes, self.active_enemies, self.tilemap, offset_x, offset_y)
+
+    def draw_scene(self, canvas, offset_x, offset_y, scaler=None):
+        draw_scene(canvas, self.background, self.player, self.active_objects, self.active_runes,
+                   self.active_enemies, self.tilemap, offset_x, offset_y, scaler)
+
+    # Switches to a quality tier from governor.py (only changes how the game looks, not how it plays)
+    def set_quality(self, tier):
+        self.animation_margin = tier.animation_margin
+        self.background.update_interval = tier.background_interval
+
+    # The area enemies still animate in, or None if all of them do
+    def animation_area(self):
+        if self.animation_margin is None:
+            return None
+        area = pygame.Rect(int(self.offset_x), int(self.offset_y), WIDTH, HEIGHT)
+        return area.inflate(self.animation_margin * 2, self.animation_margin * 2)
+
+# Main Function that handles everything that happens, including window, time, sprites, and logic.
+# Runs the game. If record_path is given, the input of every tick is saved there as a replay when the game is closed.
+def main(window, record_path=None):
+    
+    # Handles time in pygame 
+    clock = pygame.time.Clock()
+
+    level = 'GoblinBroMap1.csv'
+    game = Game(level)
+    profiler = game.profiler
+
+    recording = None
+    if record_path:
+        from replay import Recording
+        recording = Recording(level)
+
+    # Window sized back buffer, everything is drawn at its camera offset
+    renderer = DirtyRenderer(window)
 
+    # Drops to lower quality tiers while frames take too long, and back up once they don't
+    governor = FrameGovernor(1000 / FPS, enabled=ADAPTIVE_QUALITY)
+    renderers = {1.0: renderer}
+
+    run = True
+
+    # Time that still has to be simulated. Starts with one tick so there is something to draw.
+    accumulator = SIM_DT
+    jump = False
+
+    # Loop for while game is running
+    while run:
+        
+        # Goes through time
+        accumulator += min(clock.tick(FPS) / 1000, MAX_TICKS_PER_FRAME * SIM_DT)
+        start = profiler.begin_frame()
+        governor.begin_frame()
+
+        # Handles certian events, such as quitting and jumping
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+                break
             
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_UP:
+                jump = True
+
+            # F3 shows the frame profiler, F4 saves what it recorded (and the quality tiers' telemetry)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
+                renderer.invalidate()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                print("Saved profile to", *profiler.dump(), governor.dump())
+
+        if profiler.enabled:
+            profiler.lap("events", start)
+
+        # Runs as many fixed ticks as the time that passed needs, so a slow frame doesn't slow the game down.
+        # A jump is only used by the first tick, and waits for the next frame if no tick runs now.
+        ticks = 0
+        while accumulator >= SIM_DT and ticks < MAX_TICKS_PER_FRAME:
+            inputs = InputState.from_keyboard(jump)
+            if recording is not None:
+                recording.record(inputs)
+            game.step(inputs)
+            jump = False
+            accumulator -= SIM_DT
+            ticks += 1
+
+        # Anything left after too many ticks is dropped instead of carried forever
+        accumulator = min(accumulator, SIM_DT)
+        
+        # Draws everyting to the canvas!
+        if profiler.enabled:
+            start = time.perf_counter()
+        game.draw(renderer, accumulator / SIM_DT if INTERPOLATE else 1)
+
+        if not startup_report.done:
+            startup_report.first_frame()
+            if PRINT_STARTUP_REPORT:
+                print(startup_report.report())
+
+        if profiler.enabled:
+            profiler.lap("draw", start)
+            if profiler.show_overlay:
+                # Drawn straight over the window, the renderer redraws under it when it is turned off
+                pygame.display.update(profiler.draw_overlay(window))
+        profiler.end_frame()
+
+        # A new tier takes effect from the next frame
+        if governor.end_frame():
+            tier = governor.tier
+            game.set_quality(tier)
+            renderer = renderers.get(tier.render_scale)
+            if renderer is None:
+                renderer = renderers[tier.render_scale] = ScaledRenderer(window, tier.render_scale)
+            renderer.invalidate()
+            
+    if recording is not None:
+        recording.finish(game)
+        recording.save(record_path)
+        print(f"Saved {len(recording)} ticks of input to {record_path}")
+
     # Quits game when quit!
     pygame.quit()
     quit()       
    
     pass
 
+startup_report.times["import"] = time.perf_counter() - IMPORT_START
+
 # Begins Main Function for simple always true check
 if __name__ == "__main__":
-    main(window)
+    parser = argparse.ArgumentParser(description="Goblin Bro")
+    parser.add_argument("--record", metavar="PATH", help="save the input of this run as a replay (see replay.py)")
+    args = parser.parse_args()
+    main(startup(), args.record)
 
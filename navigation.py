@@ -0,0 +1,213 @@
+import math
+import heapq
+from collections import deque
+
+# Navigation graph for enemies that chase the player around the map.
+#
+# The graph is built once from every tile in the map, loaded or not (see TileMap.tile_cells). Every run of tiles
+# with open space above it is a segment (a platform something can walk along), and segments are joined by links:
+# dropping off the end of one onto whatever is below, and jumping across a gap or up onto a nearby platform. Paths
+# between segments are found with A* and cached by (segment, target segment), and the whole graph and cache are
+# rebuilt the next time they are used after the map is edited (TileMap.version). Searches that aren't cached are
+# queued and only a few are run each tick (see update), so many enemies asking at once can't blow a frame.
+
+# A walkable run of tiles: columns first to last on a row, stood on at y (the top of the tiles)
+class Segment():
+    def __init__(self, index, row, first, last, size):
+        self.index = index
+        self.row = row
+        self.first = first
+        self.last = last
+        self.left = first * size
+        self.right = (last + 1) * size
+        self.y = row * size
+        self.links = []
+
+    def __repr__(self):
+        return f"Segment({self.index}, row {self.row}, cols {self.first}-{self.last})"
+
+# A way from one segment to another: leave from_segment at from_x and come down on to_segment at to_x
+class Link():
+    def __init__(self, kind, from_segment, from_x, to_segment, to_x, cost):
+        self.kind = kind  # "drop" or "jump"
+        self.from_segment = from_segment
+        self.from_x = from_x
+        self.to_segment = to_segment
+        self.to_x = to_x
+        self.cost = cost
+
+    def __repr__(self):
+        return f"Link({self.kind}, {self.from_segment.index}@{self.from_x} -> {self.to_segment.index}@{self.to_x})"
+
+class NavigationGraph():
+    # jump_rows/jump_cols: how many tiles up and across a jump can reach
+    def __init__(self, tilemap, jump_rows=1, jump_cols=2, searches_per_tick=2):
+        self.tilemap = tilemap
+        self.jump_rows = jump_rows
+        self.jump_cols = jump_cols
+        self.searches_per_tick = searches_per_tick
+        self.segments = []
+        self.cells = {}  # (col, row) -> segment standing on that tile
+        self.paths = {}  # (segment, target segment) -> list of links, or None if there is no way
+        self.pending = deque()
+        self.queued = set()
+        self.built_version = None
+        self.searches = 0
+        self.cache_hits = 0
+
+    # Rebuilds the graph (and forgets every path) if the tilemap changed since it was built
+    def refresh(self):
+        if self.built_version != self.tilemap.version:
+            self.build()
+
+    def build(self):
+        tilemap = self.tilemap
+        size = tilemap.tile_size
+        solid = tilemap.tile_cells()
+
+        # Runs of tiles with nothing on top, row by row
+        self.segments = []
+        self.cells = {}
+        walkable = sorted((cell for cell in solid if (cell[0], cell[1] - 1) not in solid), key=lambda cell: (cell[1], cell[0]))
+        for col, row in walkable:
+            segment = self.cells.get((col - 1, row))
+            if segment is not None:
+                segment.last = col
+                segment.right = (col + 1) * size
+            else:
+                segment = Segment(len(self.segments), row, col, col, size)
+                self.segments.append(segment)
+            self.cells[(col, row)] = segment
+
+        bottom_row = max((row for _, row in solid), default=0)
+        by_row = {}
+        for segment in self.segments:
+            by_row.setdefault(segment.row, []).append(segment)
+
+        for segment in self.segments:
+            # Drops off each end, onto the first tile below in the column next to it
+            for col, edge_x in ((segment.first - 1, segment.left), (segment.last + 1, segment.right)):
+                if (col, segment.row - 1) in solid:
+                    continue  # A wall, not an edge
+                for row in range(segment.row, bottom_row + 1):
+                    if (col, row) in solid:
+                        target = self.cells.get((col, row))
+                        if target is not None:
+                            to_x = col * size + size // 2
+                            segment.links.append(Link("drop", segment, edge_x, target, to_x,
+                                                      abs(to_x - edge_x) + (row - segment.row) * size))
+                        break
+
+            # Jumps to platforms a few tiles away, up to jump_rows higher or lower
+            for row in range(segment.row - self.jump_rows, segment.row + self.jump_rows + 1):
+                for target in by_row.get(row, ()):
+                    if target.first > segment.last:
+                        gap = target.first - segment.last - 1
+                        from_x, to_x = segment.right - size // 2, target.left + size // 2
+                    elif target.last < segment.first:
+                        gap = segment.first - target.last - 1
+                        from_x, to_x = segment.left + size // 2, target.right - size // 2
+                    else:
+                        continue
+                    if gap <= self.jump_cols and (gap > 0 or row != segment.row):
+                        cost = math.hypot(to_x - from_x, target.y - segment.y) + size
+                        segment.links.append(Link("jump", segment, from_x, target, to_x, cost))
+
+        self.paths = {}
+        self.pending.clear()
+        self.queued.clear()
+        self.built_version = tilemap.version
+
+    # The segment under a point (x, feet y), looking a few tiles down in case whoever is there is in the air
+    def segment_at(self, x, y, depth=4):
+        self.refresh()
+        size = self.tilemap.tile_size
+        col = int(x) // size
+        row = int(y) // size
+        for below in range(row, row + depth):
+            segment = self.cells.get((col, below))
+            if segment is not None:
+                return segment
+        return None
+
+    # A* from a point on start to goal_x on the segment goal. Returns the links to follow, or None if it can't be
+    # reached. A state is a segment and the x it was reached at, since where along a segment you are changes what
+    # is close. Reaching the goal segment queues the walk along it to goal_x, and the search is only over once that
+    # comes off the queue, so a landing far from goal_x doesn't win over a slightly longer way in that lands close.
+    def search(self, start, start_x, goal, goal_x):
+        self.searches += 1
+        start_state = (start.index, start_x)
+        open_list = [(0, 0, start_state, start, False)]
+        came_from = {}
+        best = {start_state: 0}
+        order = 0
+
+        while open_list:
+            _, _, state, segment, arrived = heapq.heappop(open_list)
+            if arrived:
+                path = []
+                while state != start_state:
+                    link, state = came_from[state]
+                    path.append(link)
+                path.reverse()
+                return path
+
+            cost = best[state]
+            x = state[1]
+            if segment is goal:
+                order += 1
+                heapq.heappush(open_list, (cost + abs(goal_x - x), order, state, segment, True))
+                continue
+
+            for link in segment.links:
+                target = link.to_segment
+                new_cost = cost + abs(x - link.from_x) + link.cost
+                new_state = (target.index, link.to_x)
+                if new_cost >= best.get(new_state, math.inf):
+                    continue
+                best[new_state] = new_cost
+                came_from[new_state] = (link, state)
+                order += 1
+                estimate = math.hypot(goal_x - link.to_x, goal.y - target.y)
+                heapq.heappush(open_list, (new_cost + estimate, order, new_state, target, False))
+        return None
+
+    # Asks for the way from a point to another (both as (x, feet y)).
+    # Returns the links to follow ([] when both are on the same segment), or None if there is no path yet, either
+    # because the search is queued for a later tick or because there is no way there.
+    def request(self, start_point, goal_point):
+        start = self.segment_at(*start_point)
+        goal = self.segment_at(*goal_point)
+        if start is None or goal is None:
+            return None
+        if start is goal:
+            return []
+
+        key = (start.index, goal.index)
+        if key in self.paths:
+            self.cache_hits += 1
+            return self.paths[key]
+        if key not in self.queued:
+            self.queued.add(key)
+            self.pending.append((start, start_point[0], goal, goal_point[0]))
+        return None
+
+    # Runs up to searches_per_tick of the queued searches. Called once a tick.
+    def update(self):
+        self.refresh()
+        for _ in range(min(self.searches_per_tick, len(self.pending))):
+            start, start_x, goal, goal_x = self.pending.popleft()
+            key = (start.index, goal.index)
+            self.queued.discard(key)
+            self.paths[key] = self.search(start, start_x, goal, goal_x)
+
+    # Counters for debugging and benchmarks
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "links": sum(len(segment.links) for segment in self.segments),
+            "cached_paths": len(self.paths),
+            "pending": len(self.pending),
+            "searches": self.searches,
+            "cache_hits": self.cache_hits,
+        }
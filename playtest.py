@@ -0,0 +1,163 @@
+# Plays lots of levels headless at once, to check level edits without playing them by hand.
+#
+# Every run is a level and an input script. Runs are shared out over a process pool (one process per core by
+# default); each worker starts pygame headless and loads the assets once, and keeps every tilemap it has loaded,
+# so a worker only pays for a level the first time it plays it.
+#
+#   python playtest.py jobs.txt                   # one "level script" pair per line
+#   python playtest.py jobs.txt --json out.json   # also save every outcome
+#
+# A script is either a replay file from main.py --record (.rpl) or a text file with one line per stretch of input:
+#
+#   60 right          # hold right for 60 ticks
+#   1 right jump      # jump (a jump only presses on the first tick of its line)
+#   30                # nothing held for 30 ticks
+import os
+import sys
+import json
+import time
+import argparse
+from multiprocessing import Pool
+
+# Set in each worker by start_worker
+worker = None
+
+# Reads a script into a list of (left, right, jump) for every tick
+def read_script(path):
+    if path.endswith(".rpl"):
+        from replay import Recording
+        return list(Recording.load(path).ticks())
+
+    ticks = []
+    with open(path) as data:
+        for line_number, line in enumerate(data, 1):
+            words = line.split("#")[0].split()
+            if not words:
+                continue
+            unknown = set(words[1:]) - {"left", "right", "jump"}
+            if not words[0].isdigit() or unknown:
+                raise ValueError(f"{path}:{line_number}: expected '<ticks> [left] [right] [jump]'")
+            left, right, jump = "left" in words, "right" in words, "jump" in words
+            for tick in range(int(words[0])):
+                ticks.append((left, right, jump and tick == 0))
+    return ticks
+
+# What a worker keeps between runs
+class Worker():
+    def __init__(self):
+        # SDL would catch SIGTERM otherwise, and the pool couldn't stop its workers
+        os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+        import headless
+        import main
+        self.main = main
+        self.window = headless.window
+        self.tilemaps = {}
+
+        # Loads every asset the game uses into the asset cache
+        main.Game()
+
+    def tilemap(self, level):
+        tilemap = self.tilemaps.get(level)
+        if tilemap is None:
+            tilemap = self.tilemaps[level] = self.main.TileMap(level)
+        return tilemap
+
+    # Plays one level with one script. Stops once the player wins or dies, unless play_out is set.
+    def run(self, level, script, play_out=False):
+        main = self.main
+        outcome = {"level": level, "script": script, "won": False, "win_tick": None, "death_tick": None,
+                   "damage_taken": 0, "ticks": 0, "ticks_per_second": None, "error": None}
+        try:
+            ticks = read_script(script)
+            game = main.Game(level, tilemap=self.tilemap(level))
+        except (OSError, ValueError) as error:
+            outcome["error"] = str(error)
+            return outcome
+
+        player = game.player
+        start = time.perf_counter()
+        for tick, (left, right, jump) in enumerate(ticks):
+            game.step(main.InputState(left, right, jump))
+            if outcome["win_tick"] is None and game.reached_win():
+                outcome["won"] = True
+                outcome["win_tick"] = tick
+            if outcome["death_tick"] is None and not player.is_alive:
+                outcome["death_tick"] = tick
+            if not play_out and (outcome["won"] or outcome["death_tick"] is not None):
+                break
+        elapsed = time.perf_counter() - start
+
+        health = player.health_display
+        outcome["damage_taken"] = health.max_health - health.current_health
+        outcome["ticks"] = game.ticks
+        outcome["ticks_per_second"] = round(game.ticks / elapsed, 1) if elapsed > 0 else None
+        return outcome
+
+def start_worker():
+    global worker
+    worker = Worker()
+
+def run_job(job):
+    level, script, play_out = job
+    return worker.run(level, script, play_out)
+
+# Runs every (level, script) pair and returns their outcomes in the same order
+def run_all(jobs, processes=None, play_out=False):
+    jobs = [(level, script, play_out) for level, script in jobs]
+    if processes == 1:
+        start_worker()
+        return [run_job(job) for job in jobs]
+
+    pool = Pool(processes, initializer=start_worker)
+    try:
+        outcomes = pool.map(run_job, jobs, chunksize=max(1, len(jobs) // ((processes or os.cpu_count() or 1) * 4)))
+        pool.close()
+        return outcomes
+    finally:
+        pool.terminate()
+        pool.join()
+
+# Reads a jobs file: one "level script" pair per line, with paths relative to the jobs file
+def read_jobs(path):
+    folder = os.path.dirname(path)
+    jobs = []
+    with open(path) as data:
+        for line in data:
+            words = line.split("#")[0].split()
+            if len(words) == 2:
+                jobs.append((os.path.join(folder, words[0]), os.path.join(folder, words[1])))
+            elif words:
+                raise ValueError(f"{path}: expected 'level script', got {line.strip()!r}")
+    return jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plays levels headless with input scripts, in parallel.")
+    parser.add_argument("jobs", help="file with one 'level script' pair per line")
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--play-out", action="store_true", help="keep playing after the player wins or dies")
+    parser.add_argument("--json", help="also write every outcome to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    outcomes = run_all(read_jobs(args.jobs), args.processes, args.play_out)
+    elapsed = time.perf_counter() - start
+
+    for outcome in outcomes:
+        if outcome["error"]:
+            result = "ERROR " + outcome["error"]
+        elif outcome["won"]:
+            result = f"won at tick {outcome['win_tick']}"
+        elif outcome["death_tick"] is not None:
+            result = f"died at tick {outcome['death_tick']}"
+        else:
+            result = "ran out of input"
+        print(f"{outcome['level']:24} {outcome['script']:24} {result:22} damage {outcome['damage_taken']}  "
+              f"{outcome['ticks']} ticks, {outcome['ticks_per_second']} ticks/s")
+    print(f"{len(outcomes)} runs in {elapsed:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(outcomes, out, indent=2)
+
+    if any(outcome["error"] for outcome in outcomes):
+        sys.exit(1)
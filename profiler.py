@@ -0,0 +1,153 @@
+import csv
+import json
+import time
+from array import array
+
+import pygame
+
+# Times each phase of the game loop, frame by frame.
+#
+# Timings go into fixed size ring buffers (one per phase, plus the whole frame), so it can stay on
+# for a whole session. The loop only calls lap() when enabled is True, so turning it off costs one
+# bool check per phase:
+#
+#     if profiler.enabled:
+#         start = profiler.lap("player", start)
+class FrameProfiler():
+
+    PHASES = ("events", "player", "runes", "enemies", "movement", "enemy_collisions", "camera", "draw")
+    OVERLAY_WIDTH = 300
+    GRAPH_HEIGHT = 60
+
+    def __init__(self, size=600, enabled=False):
+        self.size = size
+        self.enabled = enabled
+        self.show_overlay = False
+        self.samples = {phase: array("d", bytes(8 * size)) for phase in self.PHASES}
+        self.frame_times = array("d", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        self.frame_start = 0.0
+        self.font = None
+        self.stats = {}
+
+    # Starts timing a frame. Returns the time to pass to the first lap().
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        return self.frame_start
+
+    # Adds the time since start to a phase of this frame, and returns now so the next phase can start from it
+    def lap(self, phase, start):
+        now = time.perf_counter()
+        self.current[phase] += now - start
+        return now
+
+    # Finishes the frame and stores its timings in the ring buffers
+    def end_frame(self):
+        if not self.enabled:
+            return
+
+        index = self.index
+        for phase, seconds in self.current.items():
+            self.samples[phase][index] = seconds * 1000
+            self.current[phase] = 0.0
+        self.frame_times[index] = (time.perf_counter() - self.frame_start) * 1000
+
+        self.index = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+        # Percentiles are only worked out every few frames, sorting every buffer each frame isn't free
+        if self.show_overlay and self.index % 15 == 0:
+            self.stats = self.summary()
+
+    # Turns recording and the overlay on and off together
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.show_overlay = self.enabled
+        for phase in self.current:
+            self.current[phase] = 0.0
+
+    # Values in a ring buffer from oldest to newest
+    def ordered(self, buffer):
+        if self.count < self.size:
+            return list(buffer[:self.count])
+        return list(buffer[self.index:]) + list(buffer[:self.index])
+
+    # p50/p95/p99/max in milliseconds for every phase and the whole frame
+    def summary(self):
+        summary = {}
+        for phase, buffer in list(self.samples.items()) + [("frame", self.frame_times)]:
+            values = sorted(self.ordered(buffer))
+            if not values:
+                continue
+            summary[phase] = {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1],
+            }
+        return summary
+
+    # Writes one row per recorded frame, with the time of each phase in milliseconds
+    def to_csv(self, path):
+        columns = list(self.PHASES) + ["frame"]
+        rows = zip(*[self.ordered(self.samples[phase]) for phase in self.PHASES], self.ordered(self.frame_times))
+        with open(path, "w", newline="") as out:
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([f"{value:.4f}" for value in row])
+
+    # Writes the summary and every recorded frame
+    def to_json(self, path):
+        data = {
+            "units": "ms",
+            "summary": self.summary(),
+            "frames": {phase: self.ordered(self.samples[phase]) for phase in self.PHASES},
+            "frame_times": self.ordered(self.frame_times),
+        }
+        with open(path, "w") as out:
+            json.dump(data, out, indent=2)
+
+    # Dumps both files with a timestamp in the name, returns the paths
+    def dump(self, prefix="profile"):
+        name = time.strftime(f"{prefix}_%Y%m%d_%H%M%S")
+        self.to_csv(name + ".csv")
+        self.to_json(name + ".json")
+        return name + ".csv", name + ".json"
+
+    # Draws the percentiles and a frame time graph in the top left of the window, returns the rect it covered
+    def draw_overlay(self, window):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+
+        lines = ["phase            p50     p95     p99  (ms)"]
+        for phase, stats in self.stats.items():
+            lines.append(f"{phase:16} {stats['p50']:6.2f}  {stats['p95']:6.2f}  {stats['p99']:6.2f}")
+
+        line_height = self.font.get_linesize()
+        height = line_height * len(lines) + self.GRAPH_HEIGHT + 12
+        rect = pygame.Rect(0, 0, self.OVERLAY_WIDTH, height)
+        window.fill((0, 0, 0), rect)
+
+        for i, line in enumerate(lines):
+            window.blit(self.font.render(line, True, (255, 255, 255)), (4, 4 + i * line_height))
+
+        # One bar per frame, the line is the 60 FPS budget (16.7 ms)
+        graph = pygame.Rect(4, height - self.GRAPH_HEIGHT - 4, self.OVERLAY_WIDTH - 8, self.GRAPH_HEIGHT)
+        frames = self.ordered(self.frame_times)[-graph.width:]
+        scale = graph.height / 33.3
+        for i, ms in enumerate(frames):
+            bar = min(graph.height, int(ms * scale))
+            color = (80, 220, 80) if ms <= 16.7 else (230, 70, 70)
+            pygame.draw.line(window, color, (graph.x + i, graph.bottom), (graph.x + i, graph.bottom - bar))
+        budget = graph.bottom - int(16.7 * scale)
+        pygame.draw.line(window, (255, 255, 0), (graph.x, budget), (graph.right, budget))
+
+        return rect
+
+# Nearest rank percentile of sorted values
+def percentile(values, percent):
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
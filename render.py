@@ -0,0 +1,115 @@
+import pygame
+
+# Gets the on-screen rect of a surface drawn at a world position
+def screen_rect(image, x, y, offset_x, offset_y):
+    return pygame.Rect(x - offset_x, y - offset_y, image.get_width(), image.get_height())
+
+# Joins rects that overlap so the same area is not redrawn twice
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        i = 0
+        while i < len(merged):
+            if rect.colliderect(merged[i]):
+                rect.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    return merged
+
+# Renders into a window-sized back buffer and only pushes changed areas to the display.
+#
+# Each frame gets a list of drawables as (key, state, rect), where rect is where the thing is on screen
+# and state is anything that changes when it looks different (like the current frame surface).
+# When the camera hasn't moved, only the old and new rects of drawables whose state or rect changed
+# are redrawn (clipped) and passed to display.update. When the camera moves everything on screen
+# shifts, so the whole frame is redrawn instead.
+class DirtyRenderer():
+    def __init__(self, window):
+        self.window = window
+        self.canvas = pygame.Surface(window.get_size())
+        self.screen = self.canvas.get_rect()
+        self.last_offset = None
+        self.last_drawables = {}
+        self.full_redraws = 0
+        self.partial_redraws = 0
+        self.dirty_area = 0
+
+    # Forces the next frame to be a full redraw (after a resize or a level change, for example)
+    def invalidate(self):
+        self.last_offset = None
+
+    # Draws one frame. draw_scene(canvas, offset_x, offset_y) must draw everything and respect the clip rect.
+    def present(self, draw_scene, drawables, offset_x, offset_y):
+        offset = (int(offset_x), int(offset_y))
+        current = {key: (state, rect) for key, state, rect in drawables}
+
+        if offset != self.last_offset:
+            self.canvas.set_clip(None)
+            draw_scene(self.canvas, offset[0], offset[1])
+            self.window.blit(self.canvas, (0, 0))
+            pygame.display.update()
+            self.full_redraws += 1
+        else:
+            dirty = []
+            for key, (state, rect) in current.items():
+                previous = self.last_drawables.get(key)
+                if previous != (state, rect):
+                    dirty.append(rect)
+                    if previous is not None:
+                        dirty.append(previous[1])
+
+            # Things that stopped being drawn leave a hole that has to be filled in
+            for key, (_, rect) in self.last_drawables.items():
+                if key not in current:
+                    dirty.append(rect)
+
+            dirty = [rect.clip(self.screen) for rect in dirty]
+            dirty = merge_rects([rect for rect in dirty if rect.width and rect.height])
+
+            for rect in dirty:
+                self.canvas.set_clip(rect)
+                draw_scene(self.canvas, offset[0], offset[1])
+                self.window.blit(self.canvas, rect, rect)
+            self.canvas.set_clip(None)
+
+            if dirty:
+                pygame.display.update(dirty)
+            self.partial_redraws += 1
+            self.dirty_area += sum(rect.width * rect.height for rect in dirty)
+
+        self.last_offset = offset
+        self.last_drawables = current
+
+# Renders at a fraction of the window's resolution and scales the frame up to fill the window, for machines
+# that can't draw every pixel each frame. Always redraws the whole frame (the scale up covers the whole window
+# anyway). Sprites are shrunk the first time they are drawn and kept, so each frame is only drawn once small.
+class ScaledRenderer():
+    def __init__(self, window, scale):
+        self.window = window
+        self.scale = scale
+        width, height = window.get_size()
+        self.canvas = pygame.Surface((max(1, round(width * scale)), max(1, round(height * scale))))
+        self.shrunk = {}
+        self.full_redraws = 0
+
+    def invalidate(self):
+        pass
+
+    # A surface at this renderer's scale, made once per surface
+    def shrink(self, surface):
+        entry = self.shrunk.get(id(surface))
+        if entry is None or entry[0] is not surface:
+            width, height = surface.get_size()
+            size = (max(1, round(width * self.scale)), max(1, round(height * self.scale)))
+            entry = self.shrunk[id(surface)] = (surface, pygame.transform.scale(surface, size))
+        return entry[1]
+
+    # Draws one frame. draw_scene(canvas, offset_x, offset_y, renderer) draws everything at the renderer's scale.
+    def present(self, draw_scene, offset_x, offset_y):
+        draw_scene(self.canvas, int(offset_x), int(offset_y), self)
+        pygame.transform.scale(self.canvas, self.window.get_size(), self.window)
+        pygame.display.update()
+        self.full_redraws += 1
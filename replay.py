@@ -0,0 +1,178 @@
+# Recording and replaying the player's input.
+#
+# A recording is the level it was played on plus the keys held on every tick, so playing it back through
+# Game.step runs the exact same game again. A digest of the game at the end is saved too, so a replay can
+# tell if the game still ends up in the same place (a regression test), or just be run as fast as possible
+# as a realistic workload for the profiler.
+#
+#   python main.py --record run.rpl               # play normally and save the input
+#   python replay.py run.rpl                      # replay it uncapped and check it ends the same
+#   python replay.py run.rpl --draw --profile     # draw every tick too and print the frame profile
+#
+# File layout: a header, the level's name, then runs of (tick count, input bits) for as long as the input
+# stays the same, which is most of the time.
+import sys
+import time
+import struct
+import hashlib
+import argparse
+
+import levels
+
+MAGIC = b"GBRP"
+VERSION = 1
+# magic, version, ticks, level sha1, end state sha1, level name length
+HEADER = struct.Struct("<4sHxxI20s20sH")
+# ticks, input bits
+RUN = struct.Struct("<HB")
+MAX_RUN = 0xFFFF
+
+# Bits of one tick of input
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+
+# Anything with left, right and jump (an InputState) as bits
+def pack_input(inputs):
+    return (LEFT if inputs.left else 0) | (RIGHT if inputs.right else 0) | (JUMP if inputs.jump else 0)
+
+# Bits back to (left, right, jump)
+def unpack_input(bits):
+    return bool(bits & LEFT), bool(bits & RIGHT), bool(bits & JUMP)
+
+# Digest of everything a replay should reproduce: the player, every enemy and rune, and the tick count
+def state_digest(game):
+    game.catch_up_sleeping()
+    player = game.player
+    state = [game.ticks, player.rect.x, player.rect.y, player.health_display.current_health, player.is_alive]
+    for enemy in game.enemies:
+        state.append((enemy.rect.x, enemy.rect.y, enemy.health_display.current_health, enemy.is_alive,
+                      enemy.direction, enemy.animation_count))
+    for rune in game.runes:
+        state.append(rune.animation_count)
+    return hashlib.sha1(repr(state).encode()).digest()
+
+# The input of one run of a level
+class Recording():
+    def __init__(self, level, level_hash=None):
+        self.level = level
+        self.level_hash = levels.hash_file(level) if level_hash is None else level_hash
+        self.inputs = []
+        self.end_digest = bytes(20)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    # Adds the input of one tick
+    def record(self, inputs):
+        self.inputs.append(pack_input(inputs))
+
+    # Saves the digest of the game once the recording is over
+    def finish(self, game):
+        self.end_digest = state_digest(game)
+
+    # The input of every tick as (left, right, jump)
+    def ticks(self):
+        for bits in self.inputs:
+            yield unpack_input(bits)
+
+    # Input as (count, bits) runs
+    def runs(self):
+        runs = []
+        for bits in self.inputs:
+            if runs and runs[-1][1] == bits and runs[-1][0] < MAX_RUN:
+                runs[-1][0] += 1
+            else:
+                runs.append([1, bits])
+        return runs
+
+    def save(self, path):
+        name = self.level.encode()
+        with open(path, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, len(self.inputs), self.level_hash, self.end_digest, len(name)))
+            out.write(name)
+            for count, bits in self.runs():
+                out.write(RUN.pack(count, bits))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as data:
+            header = data.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"{path} is not a replay file")
+            magic, version, ticks, level_hash, end_digest, name_length = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a replay file this version can read")
+
+            recording = cls(data.read(name_length).decode(), level_hash)
+            recording.end_digest = end_digest
+            body = data.read()
+
+        for count, bits in RUN.iter_unpack(body[:len(body) - len(body) % RUN.size]):
+            recording.inputs.extend([bits] * count)
+        if len(recording.inputs) != ticks:
+            raise ValueError(f"{path} is cut short ({len(recording.inputs)} of {ticks} ticks)")
+        return recording
+
+# Plays a recording back through Game.step as fast as possible.
+# draw also draws every tick through the renderer (like a frame of the real loop), and profile turns the
+# game's frame profiler on for the run. Returns the game and how many ticks per second it ran at.
+def play(recording, draw=False, profile=False, window=None):
+    from main import Game, InputState, WIDTH, HEIGHT
+    from render import DirtyRenderer
+    from profiler import FrameProfiler
+    import pygame
+
+    if levels.hash_file(recording.level) != recording.level_hash:
+        raise ValueError(f"{recording.level} has changed since the replay was recorded")
+
+    game = Game(recording.level)
+    if profile:
+        # Big enough to keep every tick of the replay
+        game.profiler = FrameProfiler(size=max(1, len(recording)), enabled=True)
+    profiler = game.profiler
+    renderer = None
+    if draw:
+        renderer = DirtyRenderer(window or pygame.display.get_surface() or pygame.Surface((WIDTH, HEIGHT)))
+
+    start = time.perf_counter()
+    for left, right, jump in recording.ticks():
+        frame_start = profiler.begin_frame()
+        game.step(InputState(left, right, jump))
+        if renderer is not None:
+            if profile:
+                frame_start = time.perf_counter()
+            game.draw(renderer)
+            if profile:
+                profiler.lap("draw", frame_start)
+        profiler.end_frame()
+    elapsed = time.perf_counter() - start
+
+    return game, len(recording) / elapsed if elapsed > 0 else float("inf")
+
+# Plays a recording and checks the game ends up where it did when it was recorded
+def check(recording, **options):
+    game, ticks_per_second = play(recording, **options)
+    return state_digest(game) == recording.end_digest, game, ticks_per_second
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays recorded input and checks the game ends the same way.")
+    parser.add_argument("replay", help="replay file made with main.py --record")
+    parser.add_argument("--draw", action="store_true", help="draw every tick too, like the real game loop")
+    parser.add_argument("--profile", action="store_true", help="print the frame profile of the replay")
+    args = parser.parse_args()
+
+    import headless
+
+    recording = Recording.load(args.replay)
+    same, game, ticks_per_second = check(recording, draw=args.draw, profile=args.profile, window=headless.window)
+    print(f"{len(recording)} ticks of {recording.level}, {ticks_per_second:.0f} ticks/s")
+
+    if args.profile:
+        for phase, stats in game.profiler.summary().items():
+            print(f"{phase:18} p50 {stats['p50']:7.3f} ms  p95 {stats['p95']:7.3f} ms  max {stats['max']:7.3f} ms")
+
+    if not same:
+        print("game ended differently from the recording", file=sys.stderr)
+        sys.exit(1)
+    print("game ended the same as the recording")
@@ -1,101 +1,511 @@
 import pygame
 import os
-import csv
+import math
+import sys
+import assets
+import atlas
+from levels import load_level
+from assets import asset_size
 
-# Tile class containing each individual tile on the map.
-# Handles loading, drawing, and blitting.
-class Tile(pygame.sprite.Sprite):
+# One kind of tile (one part of Terrain.png): its atlas frame and mask, shared by every tile of that kind.
+# The map only uses a handful of kinds, so the surfaces and masks only exist once each however big the map is.
+class TileType():
     tile_image = None
-    
-    def __init__(self, x, y, size, startX, startY):
-        super().__init__()
-        self.rect = pygame.Rect(x, y, size, size)
-        self.image = pygame.Surface((size, size), pygame.SRCALPHA)
 
-        if Tile.tile_image is None:
+    def __init__(self, tile_id, size, startX, startY):
+        self.tile_id = tile_id
+        self.size = size
+        self.image = TileType.get_frame(size, startX, startY)
+        self.mask = pygame.mask.from_surface(self.image)
+        # Fully opaque tiles can be merged into SolidBlocks for collision
+        self.solid = self.mask.count() == size * size
+
+    # Cuts a part of Terrain.png out into the texture atlas
+    @staticmethod
+    def get_frame(size, startX, startY):
+        if TileType.tile_image is None:
             path = os.path.join("assets", "Terrain", "Terrain.png")
-            Tile.tile_image = pygame.image.load(path).convert_alpha()
-        
+            TileType.tile_image = assets.load_image(path)
+
         tile_surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
         rect = pygame.Rect(startX, startY, size, size)
-        tile_surface.blit(Tile.tile_image, (0, 0), area=rect)
+        tile_surface.blit(TileType.tile_image, (0, 0), area=rect)
+        return atlas.shared.add(tile_surface)
 
-        self.image.blit(tile_surface, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
+# Tile types by (tile id, size), made the first time they are used
+tile_types = {}
+
+# The TileType for a tile id from the csv map, or None if the id is empty (like -1)
+def get_tile_type(tile_id, size):
+    key = (tile_id, size)
+    tile_type = tile_types.get(key)
+    if tile_type is None:
+        source = TILE_TYPES.get(tile_id)
+        if source is None:
+            return None
+        tile_type = tile_types[key] = TileType(tile_id, size, source[0], source[1])
+    return tile_type
+
+# One tile placed on the map: just its type and where it is.
+# Its image and mask come from the type, so a tile costs a small record instead of a sprite with its own mask.
+class Tile():
+    __slots__ = ("type", "rect")
 
+    def __init__(self, tile_type, x, y):
+        self.type = tile_type
+        self.rect = pygame.Rect(x, y, tile_type.size, tile_type.size)
+
+    @property
+    def image(self):
+        return self.type.image
+
+    @property
+    def mask(self):
+        return self.type.mask
 
     def draw(self, surface, offset_x, offset_y):
-        surface.blit(self.image, (self.rect.x - offset_x, self.rect.y - offset_y))
+        surface.blit(self.type.image, (self.rect.x - offset_x, self.rect.y - offset_y))
+
+# A solid rectangle of terrain made by merging fully opaque tiles together.
+# Collision with it is a rect test instead of a pixel by pixel mask test.
+class SolidBlock():
+    def __init__(self, rect):
+        self.rect = rect
+
+# Full masks by size, used to test a mask against a solid rect
+full_masks = {}
+
+# Checks if any set pixel of mask (drawn at position) is inside rect
+def mask_overlaps_rect(mask, position, rect):
+    mask_rect = pygame.Rect(position, mask.get_size())
+    clip = rect.clip(mask_rect)
+    if not clip.width or not clip.height:
+        return False
+
+    full = full_masks.get(clip.size)
+    if full is None:
+        full = full_masks[clip.size] = pygame.mask.Mask(clip.size, fill=True)
+    return mask.overlap(full, (clip.x - mask_rect.x, clip.y - mask_rect.y)) is not None
+
+# Checks if a sprite (anything with a rect and mask) touches a piece of terrain (a SolidBlock or a Tile)
+def collide_terrain(sprite, terrain):
+    if isinstance(terrain, SolidBlock):
+        return mask_overlaps_rect(sprite.mask, sprite.rect.topleft, terrain.rect)
+    return pygame.sprite.collide_mask(sprite, terrain)
+
+# Where each tile id from the csv map is in Terrain.png (ids that aren't here, like -1, are empty)
+TILE_TYPES = {
+    0: (0, 0),
+    1: (96, 0),
+    2: (192, 0),
+    5: (0, 96),
+    6: (96, 96),
+    7: (192, 96),
+}
 
 # Reusable class that handles loading from the csv map file and uses the Tile class to create the map.
+#
+# With streaming=True, tiles are only built for the chunks near the camera (see update_stream), and chunks
+# far away are thrown away again, so the whole map never has to be in memory at once.
 class TileMap():
-    def __init__(self, file_name):
+    def __init__(self, file_name, streaming=False, max_resident_chunks=48):
         self.tile_size = 96
         self.start_y = 0
         self.start_x = 0
-        self.tiles = self.load_tiles(file_name)
+        # Terrain is pre-rendered into chunks of chunk_tiles x chunk_tiles tiles.
+        # A chunk is baked the first time it is drawn and only re-baked after a tile under it changes.
+        self.chunk_tiles = 8
+        self.chunk_size = self.chunk_tiles * self.tile_size
+        self.chunks = {}
+        # Baked chunks shrunk for drawing at a lower resolution: chunk -> {scale: surface}
+        self.scaled_chunks = {}
+        # Uniform grid of (col, row) -> tiles, so collision only checks tiles near the player
+        self.grid = {}
+        self.tiles = []
+        # Merged collision geometry (solid blocks plus tiles that are partly see-through), on its own grid.
+        # Rebuilt the next time it is needed after a tile changes.
+        self.colliders = []
+        self.collision_grid = {}
+        self.collision_dirty = True
+        # The masks of the tiles that can't be merged into colliders (see build_colliders) drawn into one mask per
+        # chunk, so a sprite is tested against all of them with one Mask.overlap per chunk it touches, however many
+        # there are (see tile_touching). Made the first time a chunk is tested and thrown away with its baked chunk
+        # when a tile under it changes.
+        self.chunk_masks = {}
+        self.see_through_tiles = 0
+        # Goes up every time the map is edited (a tile added or removed), so things built from the map know to rebuild.
+        # Chunks streaming in and out aren't edits, the map is the same, only which part of it is loaded changes.
+        self.version = 0
+        # Streaming: chunk -> tiles for every chunk that is loaded right now, plus counters
+        self.streaming = streaming
+        self.max_resident_chunks = max_resident_chunks
+        self.resident = {}
+        self.chunk_loads = 0
+        self.chunk_evictions = 0
+
+        if streaming:
+            self.level = load_level(file_name)
+            self.tile_map_w = self.level.width * self.tile_size
+            self.tile_map_h = self.level.height * self.tile_size
+        else:
+            for tile in self.load_tiles(file_name):
+                self.add_tile(tile)
+            self.build_colliders()
     
-    def draw_map(self, surface, offset_x, offset_y):
-        # Draws only the visible tiles by checking offset to see if its in current view.
-        for tile in self.tiles:
-            if (tile.rect.x - offset_x > -self.tile_size and
-                tile.rect.x - offset_x < surface.get_width() and
-                tile.rect.y - offset_y > -self.tile_size and
-                tile.rect.y - offset_y < surface.get_height()):
+    def draw_map(self, surface, offset_x, offset_y, scale=1):
+        # Draws only the baked chunks that overlap the current view (or the clip area, if one is set).
+        # With scale, surface is the screen at that fraction of its size (see render.ScaledRenderer).
+        offset_x = int(offset_x)
+        offset_y = int(offset_y)
+        view = surface.get_clip()
+        if scale != 1:
+            # The clip area in full size screen pixels
+            view = pygame.Rect(int(view.x / scale), int(view.y / scale),
+                               math.ceil(view.width / scale) + 1, math.ceil(view.height / scale) + 1)
+        view = view.move(offset_x, offset_y)
+        size = self.chunk_size
 
-                tile.draw(surface, offset_x, offset_y)
+        for chunk_y in range(view.top // size, (view.bottom - 1) // size + 1):
+            for chunk_x in range(view.left // size, (view.right - 1) // size + 1):
+                if scale == 1:
+                    chunk = self.get_chunk(chunk_x, chunk_y)
+                    position = (chunk_x * size - offset_x, chunk_y * size - offset_y)
+                else:
+                    chunk = self.get_scaled_chunk(chunk_x, chunk_y, scale)
+                    position = (round((chunk_x * size - offset_x) * scale), round((chunk_y * size - offset_y) * scale))
+                if chunk is not None:
+                    surface.blit(chunk, position)
 
         return surface
+
+    # A baked chunk shrunk to scale, made once until the chunk changes
+    def get_scaled_chunk(self, chunk_x, chunk_y, scale):
+        scaled = self.scaled_chunks.setdefault((chunk_x, chunk_y), {})
+        if scale in scaled:
+            return scaled[scale]
+
+        chunk = self.get_chunk(chunk_x, chunk_y)
+        if chunk is not None:
+            size = round(self.chunk_size * scale)
+            chunk = pygame.transform.scale(chunk, (size, size))
+        scaled[scale] = chunk
+        return chunk
+
+    # Returns the baked surface for a chunk, baking it first if needed. Empty chunks are None.
+    def get_chunk(self, chunk_x, chunk_y):
+        key = (chunk_x, chunk_y)
+        if key in self.chunks:
+            return self.chunks[key]
+
+        size = self.chunk_size
+        area = pygame.Rect(chunk_x * size, chunk_y * size, size, size)
+        tiles = self.tiles_in_rect(area)
+        chunk = None
+
+        if tiles:
+            chunk = pygame.Surface((size, size), pygame.SRCALPHA, 32)
+            chunk.blits(atlas.blit_list([(tile.type.image, (tile.rect.x - area.x, tile.rect.y - area.y))
+                                         for tile in tiles]), doreturn=False)
+
+        self.chunks[key] = chunk
+        return chunk
+
+    # Throws away the baked chunks (and chunk masks) under a rect so they get re-made next time they are used
+    def invalidate_chunks(self, rect):
+        size = self.chunk_size
+        for chunk_y in range(rect.top // size, (rect.bottom - 1) // size + 1):
+            for chunk_x in range(rect.left // size, (rect.right - 1) // size + 1):
+                self.chunks.pop((chunk_x, chunk_y), None)
+                self.chunk_masks.pop((chunk_x, chunk_y), None)
+                self.scaled_chunks.pop((chunk_x, chunk_y), None)
+
+    # The mask of a chunk's see-through tiles, or None if it has none
+    def get_chunk_mask(self, key):
+        if key in self.chunk_masks:
+            return self.chunk_masks[key]
+
+        size = self.chunk_size
+        area = pygame.Rect(key[0] * size, key[1] * size, size, size)
+        chunk_mask = None
+        for tile in self.tiles_in_rect(area):
+            if self.mergeable(tile):
+                continue
+            if chunk_mask is None:
+                chunk_mask = pygame.mask.Mask((size, size))
+            chunk_mask.draw(tile.mask, (tile.rect.x - area.x, tile.rect.y - area.y))
+        self.chunk_masks[key] = chunk_mask
+        return chunk_mask
+
+    # The chunk masks under a mask drawn at position, each with the mask's offset into it
+    def masks_under(self, mask, position):
+        size = self.chunk_size
+        x, y = int(position[0]), int(position[1])
+        width, height = mask.get_size()
+        for chunk_y in range(y // size, (y + height - 1) // size + 1):
+            for chunk_x in range(x // size, (x + width - 1) // size + 1):
+                chunk_mask = self.get_chunk_mask((chunk_x, chunk_y))
+                if chunk_mask is not None:
+                    yield chunk_mask, (x - chunk_x * size, y - chunk_y * size)
+
+    # First point (in map coordinates) where a mask drawn at position touches a see-through tile, or None
+    def overlap(self, mask, position):
+        for chunk_mask, (x, y) in self.masks_under(mask, position):
+            point = chunk_mask.overlap(mask, (x, y))
+            if point is not None:
+                return int(position[0]) - x + point[0], int(position[1]) - y + point[1]
+        return None
+
+    # The see-through tile a mask drawn at position touches (one overlap test against the chunk masks), or None
+    def tile_touching(self, mask, position):
+        if not self.see_through_tiles:
+            return None
+        point = self.overlap(mask, position)
+        if point is None:
+            return None
+        for tile in self.tiles_in_rect(pygame.Rect(point, (1, 1))):
+            if (not self.mergeable(tile) and tile.rect.collidepoint(point) and
+                    tile.mask.get_at((point[0] - tile.rect.x, point[1] - tile.rect.y))):
+                return tile
+        return None
     
-    # Reads the csv file and stores the data in a list.
-    def read_csv(self, file_name):
-        tileMap_1 = []
-        with open(os.path.join(file_name)) as data:
-            data = csv.reader(data, delimiter=",")
-            for row in data:
-                tileMap_1.append(list(row))
-        return tileMap_1
-    
-    # Loads the tiles from the csv file and creates a Tile object for each tile.
+    # Loads the tiles from the csv file (through its compiled .lvl version) and creates a Tile object for each tile.
     def load_tiles(self, file_name):
+        level = load_level(file_name)
+        tiles = self.build_tiles(level, 0, 0, level.width, level.height)
+        
+        # Stores the size of the whole map
+        self.tile_map_w = level.width * self.tile_size
+        self.tile_map_h = level.height * self.tile_size
+        return tiles
+
+    # Creates the Tile records for a block of cells in the level
+    def build_tiles(self, level, first_col, first_row, last_col, last_row):
         tiles = []
-        csv_map = self.read_csv(file_name)
         block_size = self.tile_size
+        ids = level.ids
+        width = level.width
+        types = {}
 
-        y = 0
-
-        for row in csv_map:
-            x = 0
-            for tile in row:
-                if tile == "-1": # Empty tile
-                    pass
-                elif tile == "0": # Each number corresponds to a different tile in the sprite sheet, so I am assinging each one to the proper tile from Terrain.png
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 0, 0))
-                elif tile == "1":
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 96, 0))
-                elif tile == "2":
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 192, 0))
-                elif tile == "5":
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 0, 96))
-                elif tile == "6":
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 96, 96))
-                elif tile == "7":
-                    tiles.append(Tile(x * block_size, y * block_size, block_size, 192, 96))
-                    # Checks next column in csv map
-                x += 1
-            # Checks next row in csv map
-            y += 1
-        
-        # Stores the size of the whole map
-        self.tile_map_w = len(csv_map[0]) * block_size
-        self.tile_map_h = len(csv_map) * block_size
+        for y in range(max(0, first_row), min(level.height, last_row)):
+            row_start = y * width
+            for x in range(max(0, first_col), min(width, last_col)):
+                # Each number is a kind of tile, TILE_TYPES has where each one is in Terrain.png
+                tile_id = ids[row_start + x]
+                tile_type = types.get(tile_id)
+                if tile_type is None:
+                    tile_type = types[tile_id] = get_tile_type(tile_id, block_size) or False
+                if tile_type:
+                    tiles.append(Tile(tile_type, x * block_size, y * block_size))
         return tiles
 
+    # Streaming: makes sure the chunks around view (a rect in map coordinates) are loaded,
+    # and unloads the chunks furthest from it once more than max_resident_chunks are loaded.
+    def update_stream(self, view, margin=None):
+        if not self.streaming:
+            return
+
+        if margin is None:
+            margin = self.chunk_size
+        area = view.inflate(margin * 2, margin * 2).clip(pygame.Rect(0, 0, self.tile_map_w, self.tile_map_h))
+        size = self.chunk_size
+
+        needed = set()
+        if area.width and area.height:
+            for chunk_y in range(area.top // size, (area.bottom - 1) // size + 1):
+                for chunk_x in range(area.left // size, (area.right - 1) // size + 1):
+                    needed.add((chunk_x, chunk_y))
+
+        for key in needed:
+            if key not in self.resident:
+                self.load_chunk(key)
+
+        # Furthest chunks go first, but never one that is needed right now
+        extra = len(self.resident) - self.max_resident_chunks
+        if extra > 0:
+            center_x, center_y = view.center
+            far = sorted((key for key in self.resident if key not in needed),
+                         key=lambda key: -((key[0] * size + size // 2 - center_x) ** 2 +
+                                           (key[1] * size + size // 2 - center_y) ** 2))
+            for key in far[:extra]:
+                self.evict_chunk(key)
+
+    # Builds the tiles for one chunk and adds them to the map
+    def load_chunk(self, key):
+        chunk_x, chunk_y = key
+        tiles_per_chunk = self.chunk_tiles
+        tiles = self.build_tiles(self.level, chunk_x * tiles_per_chunk, chunk_y * tiles_per_chunk,
+                                 (chunk_x + 1) * tiles_per_chunk, (chunk_y + 1) * tiles_per_chunk)
+        for tile in tiles:
+            self.add_tile(tile, edit=False)
+        self.resident[key] = tiles
+        self.chunk_loads += 1
+
+    # Removes a chunk's tiles from the map so they can be freed
+    def evict_chunk(self, key):
+        for tile in self.resident.pop(key):
+            self.remove_tile(tile, edit=False)
+        self.chunks.pop(key, None)
+        self.chunk_evictions += 1
+
+    # Memory used by loaded tiles and baked chunks, in bytes (roughly).
+    # Each tile type (and the atlas page their images are on) is only counted once, the tiles just point at them.
+    def resident_bytes(self):
+        types = {id(tile.type): tile.type for tile in self.tiles}
+        total = asset_size([(tile_type.image, tile_type.mask) for tile_type in types.values()])
+        total += len(self.tiles) * (sys.getsizeof(Tile.__new__(Tile)) + sys.getsizeof(pygame.Rect(0, 0, 0, 0)))
+        total += sum(asset_size(chunk) for chunk in self.chunks.values() if chunk is not None)
+        total += sum(asset_size(chunk) for scaled in self.scaled_chunks.values() for chunk in scaled.values()
+                     if chunk is not None)
+        return total
+
+    # Counters for streaming
+    def stream_stats(self):
+        return {
+            "resident_chunks": len(self.resident),
+            "resident_tiles": len(self.tiles),
+            "resident_bytes": self.resident_bytes(),
+            "chunk_loads": self.chunk_loads,
+            "chunk_evictions": self.chunk_evictions,
+        }
+
+
+    # The (col, row) of every tile in the whole map. A streaming map reads them from its level,
+    # so the answer doesn't depend on which chunks happen to be loaded.
+    def tile_cells(self):
+        size = self.tile_size
+        if not self.streaming:
+            return {(tile.rect.x // size, tile.rect.y // size) for tile in self.tiles}
+        width = self.level.width
+        return {(index % width, index // width) for index, tile_id in enumerate(self.level.ids) if tile_id in TILE_TYPES}
 
     def get_tiles(self):
         return self.tiles
 
+    # Gets the range of grid cells that a rect covers
+    def cell_range(self, rect):
+        size = self.tile_size
+        left = rect.left // size
+        top = rect.top // size
+        right = (rect.right - 1) // size
+        bottom = (rect.bottom - 1) // size
+        return left, top, right, bottom
+
+    # Adds a tile to the map and to every grid cell it covers.
+    # edit=False is for tiles that were always in the map and are only being loaded (see version).
+    def add_tile(self, tile, edit=True):
+        self.tiles.append(tile)
+        self.invalidate_chunks(tile.rect)
+        self.collision_dirty = True
+        if not self.mergeable(tile):
+            self.see_through_tiles += 1
+        if edit:
+            self.version += 1
+        left, top, right, bottom = self.cell_range(tile.rect)
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                self.grid.setdefault((col, row), []).append(tile)
+
+    # Removes a tile from the map and from the grid cells it was in
+    def remove_tile(self, tile, edit=True):
+        self.tiles.remove(tile)
+        self.invalidate_chunks(tile.rect)
+        self.collision_dirty = True
+        if not self.mergeable(tile):
+            self.see_through_tiles -= 1
+        if edit:
+            self.version += 1
+        left, top, right, bottom = self.cell_range(tile.rect)
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                cell = self.grid.get((col, row))
+                if cell and tile in cell:
+                    cell.remove(tile)
+                    if not cell:
+                        del self.grid[(col, row)]
+
+    # Returns the tiles in the grid cells that the rect overlaps, row by row like the csv.
+    def tiles_in_rect(self, rect):
+        found = []
+        seen = set()
+        left, top, right, bottom = self.cell_range(rect)
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                for tile in self.grid.get((col, row), ()):
+                    if id(tile) not in seen:
+                        seen.add(id(tile))
+                        found.append(tile)
+        return found
+
+    # Whether a tile is fully opaque and grid aligned, so it can be merged into a SolidBlock
+    def mergeable(self, tile):
+        size = self.tile_size
+        return (tile.rect.width == size and tile.rect.height == size and tile.rect.x % size == 0
+                and tile.rect.y % size == 0 and tile.type.solid)
+
+    # Merges fully opaque, grid aligned tiles into as few rects as possible (greedy meshing).
+    # Each row of solid cells is split into runs, and runs with the same columns in the rows below are
+    # joined into one taller rect. Tiles with see-through pixels are tested through the chunk masks instead.
+    def build_colliders(self):
+        size = self.tile_size
+        solid = set()
+        colliders = []
+
+        for tile in self.tiles:
+            if self.mergeable(tile):
+                solid.add((tile.rect.x // size, tile.rect.y // size))
+
+        # Runs of solid cells in each row, as (first col, last col)
+        rows = {}
+        for col, row in sorted(solid, key=lambda cell: (cell[1], cell[0])):
+            runs = rows.setdefault(row, [])
+            if runs and runs[-1][1] == col - 1:
+                runs[-1][1] = col
+            else:
+                runs.append([col, col])
+
+        # Grows each run down while the next row has the exact same run
+        open_runs = {}
+        blocks = []
+        for row in sorted(rows):
+            still_open = {}
+            for first, last in rows[row]:
+                start_row = open_runs.pop((first, last, row - 1), row)
+                still_open[(first, last, row)] = start_row
+            for (first, last, end_row), start_row in open_runs.items():
+                blocks.append((first, last, start_row, end_row))
+            open_runs = still_open
+        for (first, last, end_row), start_row in open_runs.items():
+            blocks.append((first, last, start_row, end_row))
+
+        for first, last, start_row, end_row in blocks:
+            colliders.append(SolidBlock(pygame.Rect(first * size, start_row * size,
+                                                    (last - first + 1) * size, (end_row - start_row + 1) * size)))
 
+        # Same order as the csv (top to bottom, left to right)
+        colliders.sort(key=lambda collider: (collider.rect.y, collider.rect.x))
 
+        self.colliders = colliders
+        self.collision_grid = {}
+        for collider in colliders:
+            left, top, right, bottom = self.cell_range(collider.rect)
+            for row in range(top, bottom + 1):
+                for col in range(left, right + 1):
+                    self.collision_grid.setdefault((col, row), []).append(collider)
+        self.collision_dirty = False
 
+    # Returns the merged collision geometry near a rect, in csv order
+    def colliders_in_rect(self, rect):
+        if self.collision_dirty:
+            self.build_colliders()
 
+        found = []
+        seen = set()
+        left, top, right, bottom = self.cell_range(rect)
+        for row in range(top, bottom + 1):
+            for col in range(left, right + 1):
+                for collider in self.collision_grid.get((col, row), ()):
+                    if id(collider) not in seen:
+                        seen.add(id(collider))
+                        found.append(collider)
+        found.sort(key=lambda collider: (collider.rect.y, collider.rect.x))
+        return found